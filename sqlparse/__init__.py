@@ -16,31 +16,53 @@ from sqlparse import tokens
 from sqlparse import filters
 from sqlparse import formatter
 
-from sqlparse.compat import text_type
-
 __version__ = '0.3.2.dev0'
 __all__ = ['engine', 'filters', 'formatter', 'sql', 'tokens', 'cli']
 
 
-def parse(sql, encoding=None):
+def parse(sql, encoding=None, spans=False, dialect=None,
+          weak_parents=False, grouping='full'):
     """Parse sql and return a list of statements.
 
     :param sql: A string containing one or more SQL statements.
     :param encoding: The encoding of the statement (optional).
+    :param spans: If ``True`` tokens know their position in *sql*
+      (optional).
+    :param dialect: The SQL dialect, one of
+      :data:`~sqlparse.keywords.DIALECTS` (optional).
+    :param weak_parents: If ``True`` tokens reference their parents weakly,
+      so statements are freed without the cyclic garbage collector. Tokens
+      lose their parent when their statement is freed (optional).
+    :param grouping: How far tokens are grouped, one of the levels
+      ``'blocks'``, ``'identifiers'`` or ``'full'``, a grouping pass or an
+      iterable of them. The passes they require are run too (optional).
     :returns: A tuple of :class:`~sqlparse.sql.Statement` instances.
     """
-    return tuple(parsestream(sql, encoding))
+    return tuple(parsestream(sql, encoding, spans, dialect, weak_parents,
+                             grouping))
 
 
-def parsestream(stream, encoding=None):
+def parsestream(stream, encoding=None, spans=False, dialect=None,
+                weak_parents=False, grouping='full'):
     """Parses sql statements from file-like object.
 
     :param stream: A file-like object.
     :param encoding: The encoding of the stream contents (optional).
+    :param spans: If ``True`` tokens know their position in the stream
+      (optional).
+    :param dialect: The SQL dialect (optional).
+    :param weak_parents: If ``True`` tokens reference their parents weakly
+      (optional).
+    :param grouping: A grouping level, a grouping pass or an iterable
+      of them, see :func:`~sqlparse.engine.grouping.resolve_passes` (optional).
     :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
     """
-    stack = engine.FilterStack()
-    stack.enable_grouping()
+    stack = engine.FilterStack(dialect)
+    stack.enable_grouping(grouping)
+    if spans:
+        stack.enable_spans()
+    if weak_parents:
+        stack.enable_weak_parents()
     return stack.run(stream, encoding)
 
 
@@ -54,19 +76,22 @@ def format(sql, encoding=None, **options):
 
     :returns: The formatted SQL statement as string.
     """
-    stack = engine.FilterStack()
     options = formatter.validate_options(options)
+    stack = engine.FilterStack(options.get('dialect'))
     stack = formatter.build_filter_stack(stack, options)
     stack.postprocess.append(filters.SerializerUnicode())
     return u''.join(stack.run(sql, encoding))
 
 
-def split(sql, encoding=None):
+def split(sql, encoding=None, dialect=None):
     """Split *sql* into single statements.
 
     :param sql: A string containing one or more SQL statements.
     :param encoding: The encoding of the statement (optional).
+    :param dialect: The SQL dialect (optional).
     :returns: A list of strings.
     """
-    stack = engine.FilterStack()
-    return [text_type(stmt).strip() for stmt in stack.run(sql, encoding)]
+    table = engine.FilterStack(dialect).tokenize(sql, encoding)
+    splitter = engine.StatementSplitter()
+    return [table.value(first, stop).strip()
+            for first, stop in splitter.split_table(table)]
@@ -28,6 +28,7 @@ from codecs import open, getreader
 import sqlparse
 from sqlparse.compat import PY2
 from sqlparse.exceptions import SQLParseError
+from sqlparse.keywords import DIALECTS
 
 
 # TODO: Add CLI Tests
@@ -142,6 +143,14 @@ def create_parser():
         type=bool,
         help='Insert linebreak before comma (default False)')
 
+    group.add_argument(
+        '--dialect',
+        dest='dialect',
+        metavar='DIALECT',
+        choices=sorted(DIALECTS),
+        help='only lex and parse DIALECT, one of {0}'.format(
+            ', '.join('"{0}"'.format(x) for x in sorted(DIALECTS))))
+
     group.add_argument(
         '--encoding',
         dest='encoding',
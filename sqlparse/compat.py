@@ -29,6 +29,8 @@ if PY3:
 
     text_type = str
     string_types = (str,)
+    unichr = chr
+    xrange = range
     from io import StringIO
     file_types = (StringIO, TextIOBase)
 
@@ -41,5 +43,7 @@ elif PY2:
 
     text_type = unicode
     string_types = (str, unicode,)
+    unichr = unichr
+    xrange = xrange
     from StringIO import StringIO
     file_types = (file, StringIO, TextIOBase)
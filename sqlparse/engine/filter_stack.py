@@ -9,36 +9,78 @@
 """filter"""
 
 from sqlparse import lexer
+from sqlparse.sql import TokenTable
 from sqlparse.engine import grouping
 from sqlparse.engine.statement_splitter import StatementSplitter
 
 
 class FilterStack(object):
-    def __init__(self):
+    def __init__(self, dialect=None):
+        self.dialect = dialect
         self.preprocess = []
         self.stmtprocess = []
         self.postprocess = []
-        self._grouping = False
+        self._grouping = None
+        self._spans = False
+        self._weak_parents = False
 
-    def enable_grouping(self):
-        self._grouping = True
+    def enable_grouping(self, passes='full'):
+        """Group the tokens of statements.
 
-    def run(self, sql, encoding=None):
-        stream = lexer.tokenize(sql, encoding)
-        # Process token stream
+        :param passes: A grouping level or the passes to run, see
+          :func:`~sqlparse.engine.grouping.resolve_passes`.
+        """
+        self._grouping = grouping.resolve_passes(passes)
+
+    def enable_spans(self):
+        """Create tokens referencing the source text by offset.
+
+        Tokens are kept in a :class:`~sqlparse.sql.TokenTable` until split
+        into statements. The source of tokens is the output of the last
+        preprocess filter, if any.
+        """
+        self._spans = True
+
+    def enable_weak_parents(self):
+        """Make statements reference the parents of their tokens weakly.
+
+        See :meth:`~sqlparse.sql.TokenList.weaken_parents`.
+        """
+        self._weak_parents = True
+
+    def tokenize(self, sql, encoding=None):
+        """Return a :class:`~sqlparse.sql.TokenTable` of *sql* after all
+        preprocess filters."""
+        text = lexer.Lexer.decode(sql, encoding)
+        table = TokenTable.from_spans(
+            lexer.Lexer.get_spans(text, dialect=self.dialect), text)
         for filter_ in self.preprocess:
-            stream = filter_.process(stream)
+            table = TokenTable.from_tokens(filter_.process(table.items()))
+        return table
+
+    def run(self, sql, encoding=None):
+        if self._spans:
+            stream = StatementSplitter().process_table(
+                self.tokenize(sql, encoding))
+        else:
+            stream = lexer.tokenize(sql, encoding, self.dialect)
+            # Process token stream
+            for filter_ in self.preprocess:
+                stream = filter_.process(stream)
 
-        stream = StatementSplitter().process(stream)
+            stream = StatementSplitter().process(stream)
 
         # Output: Stream processed Statements
         for stmt in stream:
             if self._grouping:
-                stmt = grouping.group(stmt)
+                stmt = grouping.group(stmt, self._grouping)
 
             for filter_ in self.stmtprocess:
                 filter_.process(stmt)
 
+            if self._weak_parents:
+                stmt.weaken_parents()
+
             for filter_ in self.postprocess:
                 stmt = filter_.process(stmt)
 
@@ -8,75 +8,186 @@
 
 from sqlparse import sql
 from sqlparse import tokens as T
-from sqlparse.utils import recurse, imt
+from sqlparse.compat import string_types, xrange
+from sqlparse.exceptions import SQLParseError
+from sqlparse.utils import bottom_up, recurse, Matcher
 
 T_NUMERICAL = (T.Number, T.Number.Integer, T.Number.Float)
 T_STRING = (T.String, T.String.Single, T.String.Symbol)
 T_NAME = (T.Name, T.Name.Placeholder)
 
 
-def _group_matching(tlist, cls):
-    """Groups Tokens that have beginning and end."""
-    opens = []
-    tidx_offset = 0
-    for idx, token in enumerate(list(tlist)):
-        tidx = idx - tidx_offset
+def _group_matching(tlist, classes):
+    """Groups tokens that have beginning and end.
 
+    All *classes* are matched in one scan of each token list. The result
+    is the same as grouping one class after the other, in the order of
+    *classes*: a pair of tokens of a class is only grouped if no group of
+    an earlier class separates them.
+    """
+    if not classes:
+        return
+    matchers = [(Matcher(m=cls.M_OPEN), Matcher(m=cls.M_CLOSE))
+                for cls in classes]
+    stack = [(tlist, classes, matchers)]
+    while stack:
+        tlist, classes, matchers = stack.pop()
+        for token in _group_matching_list(tlist, classes, matchers):
+            # Check inside previously grouped (i.e. comments) for classes
+            # other than the group's own.
+            other = [k for k, cls in enumerate(classes)
+                     if not isinstance(token, cls)]
+            if other:
+                stack.append((token, [classes[k] for k in other],
+                              [matchers[k] for k in other]))
+
+
+def _group_matching_list(tlist, classes, matchers):
+    """Groups the tokens of *tlist* for :func:`_group_matching` and returns
+    the groups that were in it before."""
+    # Most tokens open or close nothing, one check tells them apart
+    match_any = Matcher(m=[pattern for cls in classes
+                           for pattern in (cls.M_OPEN, cls.M_CLOSE)])
+
+    # Events of every class: lists of (token index, is open)
+    events = [[] for _ in classes]
+    groups = []
+    for idx, token in enumerate(tlist.tokens):
         if token.is_whitespace:
             # ~50% of tokens will be whitespace. Will checking early
             # for them avoid 3 comparisons, but then add 1 more comparison
             # for the other ~50% of tokens...
             continue
 
-        if token.is_group and not isinstance(token, cls):
-            # Check inside previously grouped (i.e. parenthesis) if group
-            # of different type is inside (i.e., case). though ideally  should
-            # should check for all open/close tokens at once to avoid recursion
-            _group_matching(token, cls)
+        if token.is_group:
+            groups.append(token)
             continue
 
-        if token.match(*cls.M_OPEN):
-            opens.append(tidx)
-
-        elif token.match(*cls.M_CLOSE):
-            try:
-                open_idx = opens.pop()
-            except IndexError:
-                # this indicates invalid sql and unbalanced tokens.
-                # instead of break, continue in case other "valid" groups exist
-                continue
-            close_idx = tidx
-            tlist.group_tokens(cls, open_idx, close_idx)
-            tidx_offset += close_idx - open_idx
+        if not match_any(token):
+            continue
+        for k, (match_open, match_close) in enumerate(matchers):
+            if match_open(token):
+                events[k].append((idx, True))
+            elif match_close(token):
+                events[k].append((idx, False))
+
+    # (open index, close index, class) of all groups
+    pairs = []
+    for cls, class_events in zip(classes, events):
+        if class_events:
+            regions = [(start, end) for start, end, _ in pairs]
+            pairs.extend((start, end, cls) for start, end
+                         in _match_pairs(class_events, regions))
+
+    if pairs:
+        _build_groups(tlist, pairs)
+    return groups
+
+
+def _match_pairs(events, regions):
+    """Returns the (open, close) pairs of *events*, a list of token indexes
+    of open and close tokens. Two tokens are only paired if the innermost
+    of the nested (start, end) *regions* containing them is the same."""
+    regions.sort(key=lambda region: (region[0], -region[1]))
+    # Unpaired opens inside the entered regions, the outermost first
+    stacks, ends = [[]], []
+    pairs = []
+    ridx = 0
+    for idx, is_open in events:
+        while ends and ends[-1] < idx:
+            ends.pop()
+            stacks.pop()
+        while ridx < len(regions) and regions[ridx][0] <= idx:
+            end = regions[ridx][1]
+            ridx += 1
+            if end >= idx:
+                ends.append(end)
+                stacks.append([])
+
+        opens = stacks[-1]
+        if is_open:
+            opens.append(idx)
+        elif opens:
+            pairs.append((opens.pop(), idx))
+        # else: this indicates invalid sql and unbalanced tokens.
+        # instead of break, continue in case other "valid" groups exist
+    return pairs
+
+
+def _build_groups(tlist, pairs):
+    """Replaces the tokens of each pair in *pairs* by a group, building
+    the inner groups first."""
+    starts, ends = {}, {}
+    for start, end, cls in pairs:
+        starts.setdefault(start, []).append((end, cls))
+        ends[end] = ends.get(end, 0) + 1
+
+    frames = [(None, [])]
+    for idx, token in enumerate(tlist.tokens):
+        if idx in starts:
+            for _, cls in sorted(starts[idx], key=lambda x: -x[0]):
+                frames.append((cls, []))
+        frames[-1][1].append(token)
+        for _ in xrange(ends.get(idx, 0)):
+            cls, tokens = frames.pop()
+            frames[-1][1].append(cls(tokens))
+
+    tokens = frames[0][1]
+    for token in tokens:
+        token._parent = tlist
+    tlist.tokens = tokens
+    tlist._positions = None
+    if sql._has_value(tlist):
+        # the new groups need values below one with a value
+        tlist._fill_values()
 
 
 def group_brackets(tlist):
-    _group_matching(tlist, sql.SquareBrackets)
+    _group_matching(tlist, [sql.SquareBrackets])
 
 
 def group_parenthesis(tlist):
-    _group_matching(tlist, sql.Parenthesis)
+    _group_matching(tlist, [sql.Parenthesis])
 
 
 def group_case(tlist):
-    _group_matching(tlist, sql.Case)
+    _group_matching(tlist, [sql.Case])
 
 
 def group_if(tlist):
-    _group_matching(tlist, sql.If)
+    _group_matching(tlist, [sql.If])
 
 
 def group_for(tlist):
-    _group_matching(tlist, sql.For)
+    _group_matching(tlist, [sql.For])
 
 
 def group_begin(tlist):
-    _group_matching(tlist, sql.Begin)
+    _group_matching(tlist, [sql.Begin])
+
+
+# The classes grouped by group_matching in the order of precedence, with
+# the pass grouping only that class.
+MATCHING = (
+    (sql.SquareBrackets, group_brackets),
+    (sql.Parenthesis, group_parenthesis),
+    (sql.Case, group_case),
+    (sql.If, group_if),
+    (sql.For, group_for),
+    (sql.Begin, group_begin),
+)
+
+
+def group_matching(tlist):
+    """Groups brackets, parenthesis and blocks in one scan."""
+    summary = getattr(tlist, 'summary', None)
+    _group_matching(tlist, [
+        cls for cls, func in MATCHING
+        if summary is None or _is_triggered(func, summary)])
 
 
 def group_typecasts(tlist):
-    def match(token):
-        return token.match(T.Punctuation, '::')
+    match = Matcher(m=(T.Punctuation, '::'))
 
     def valid(token):
         return token is not None
@@ -107,8 +218,7 @@ def group_typed_literal(tlist):
     # https://docs.microsoft.com/en-us/sql/odbc/reference/appendixes/interval-literals
     # https://www.postgresql.org/docs/9.1/datatype-datetime.html
     # https://www.postgresql.org/docs/9.1/functions-datetime.html
-    def match(token):
-        return imt(token, m=sql.TypedLiteral.M_OPEN)
+    match = Matcher(m=sql.TypedLiteral.M_OPEN)
 
     def match_to_extend(token):
         return isinstance(token, sql.TypedLiteral)
@@ -116,11 +226,8 @@ def group_typed_literal(tlist):
     def valid_prev(token):
         return token is not None
 
-    def valid_next(token):
-        return token is not None and token.match(*sql.TypedLiteral.M_CLOSE)
-
-    def valid_final(token):
-        return token is not None and token.match(*sql.TypedLiteral.M_EXTEND)
+    valid_next = Matcher(m=sql.TypedLiteral.M_CLOSE)
+    valid_final = Matcher(m=sql.TypedLiteral.M_EXTEND)
 
     def post(tlist, pidx, tidx, nidx):
         return tidx, nidx
@@ -132,24 +239,20 @@ def group_typed_literal(tlist):
 
 
 def group_period(tlist):
-    def match(token):
-        return token.match(T.Punctuation, '.')
-
-    def valid_prev(token):
-        sqlcls = sql.SquareBrackets, sql.Identifier
-        ttypes = T.Name, T.String.Symbol
-        return imt(token, i=sqlcls, t=ttypes)
+    match = Matcher(m=(T.Punctuation, '.'))
+    valid_prev = Matcher(i=(sql.SquareBrackets, sql.Identifier),
+                         t=(T.Name, T.String.Symbol))
+    # next_ validation is being performed in post. issue261
+    valid_post = Matcher(i=(sql.SquareBrackets, sql.Function),
+                         t=(T.Name, T.String.Symbol, T.Wildcard))
 
     def valid_next(token):
         # issue261, allow invalid next token
         return True
 
     def post(tlist, pidx, tidx, nidx):
-        # next_ validation is being performed here. issue261
-        sqlcls = sql.SquareBrackets, sql.Function
-        ttypes = T.Name, T.String.Symbol, T.Wildcard
         next_ = tlist[nidx] if nidx is not None else None
-        valid_next = imt(next_, i=sqlcls, t=ttypes)
+        valid_next = valid_post(next_)
 
         return (pidx, nidx) if valid_next else (pidx, tidx)
 
@@ -157,15 +260,16 @@ def group_period(tlist):
 
 
 def group_as(tlist):
+    is_statement = Matcher(t=(T.DML, T.DDL, T.CTE))
+
     def match(token):
         return token.is_keyword and token.normalized == 'AS'
 
     def valid_prev(token):
-        return token.normalized == 'NULL' or not token.is_keyword
+        return not token.is_keyword or token.normalized == 'NULL'
 
     def valid_next(token):
-        ttypes = T.DML, T.DDL, T.CTE
-        return not imt(token, t=ttypes) and token is not None
+        return not is_statement(token) and token is not None
 
     def post(tlist, pidx, tidx, nidx):
         return pidx, nidx
@@ -174,8 +278,7 @@ def group_as(tlist):
 
 
 def group_assignment(tlist):
-    def match(token):
-        return token.match(T.Assignment, ':=')
+    match = Matcher(m=(T.Assignment, ':='))
 
     def valid(token):
         return token is not None and token.ttype not in (T.Keyword)
@@ -194,12 +297,13 @@ def group_comparison(tlist):
     sqlcls = (sql.Parenthesis, sql.Function, sql.Identifier,
               sql.Operation)
     ttypes = T_NUMERICAL + T_STRING + T_NAME
+    valid_operand = Matcher(i=sqlcls, t=ttypes)
 
     def match(token):
         return token.ttype == T.Operator.Comparison
 
     def valid(token):
-        if imt(token, t=ttypes, i=sqlcls):
+        if valid_operand(token):
             return True
         elif token and token.is_keyword and token.normalized == 'NULL':
             return True
@@ -228,12 +332,11 @@ def group_arrays(tlist):
     sqlcls = sql.SquareBrackets, sql.Identifier, sql.Function
     ttypes = T.Name, T.String.Symbol
 
+    valid_prev = Matcher(i=sqlcls, t=ttypes)
+
     def match(token):
         return isinstance(token, sql.SquareBrackets)
 
-    def valid_prev(token):
-        return imt(token, i=sqlcls, t=ttypes)
-
     def valid_next(token):
         return True
 
@@ -248,15 +351,11 @@ def group_operator(tlist):
     ttypes = T_NUMERICAL + T_STRING + T_NAME
     sqlcls = (sql.SquareBrackets, sql.Parenthesis, sql.Function,
               sql.Identifier, sql.Operation, sql.TypedLiteral)
+    m_current = (T.Keyword,
+                 ('CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP'))
 
-    def match(token):
-        return imt(token, t=(T.Operator, T.Wildcard))
-
-    def valid(token):
-        return imt(token, i=sqlcls, t=ttypes) \
-            or (token and token.match(
-                T.Keyword,
-                ('CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP')))
+    match = Matcher(t=(T.Operator, T.Wildcard))
+    valid = Matcher(i=sqlcls, m=m_current, t=ttypes)
 
     def post(tlist, pidx, tidx, nidx):
         tlist[tidx].ttype = T.Operator
@@ -274,11 +373,8 @@ def group_identifier_list(tlist):
     ttypes = (T_NUMERICAL + T_STRING + T_NAME
               + (T.Keyword, T.Comment, T.Wildcard))
 
-    def match(token):
-        return token.match(T.Punctuation, ',')
-
-    def valid(token):
-        return imt(token, i=sqlcls, m=m_role, t=ttypes)
+    match = Matcher(m=(T.Punctuation, ','))
+    valid = Matcher(i=sqlcls, m=m_role, t=ttypes)
 
     def post(tlist, pidx, tidx, nidx):
         return pidx, nidx
@@ -290,15 +386,41 @@ def group_identifier_list(tlist):
 
 @recurse(sql.Comment)
 def group_comments(tlist):
-    tidx, token = tlist.token_next_by(t=T.Comment)
-    while token:
-        eidx, end = tlist.token_not_matching(
-            lambda tk: imt(tk, t=T.Comment) or tk.is_whitespace, idx=tidx)
-        if end is not None:
-            eidx, end = tlist.token_prev(eidx, skip_ws=False)
-            tlist.group_tokens(sql.Comment, tidx, eidx)
+    """Groups each run of comments and whitespace that is followed by
+    another token.
+
+    Like :func:`_group_next`, the grouped list is built in one forward
+    sweep.
+    """
+    match = Matcher(t=T.Comment)
+    tokens = tlist.tokens
+    head = []
+    grouped = False
+    idx = 0
+    while idx < len(tokens):
+        token = tokens[idx]
+        if match(token):
+            eidx = idx + 1
+            while eidx < len(tokens) and (
+                    match(tokens[eidx]) or tokens[eidx].is_whitespace):
+                eidx += 1
+            if eidx == len(tokens):
+                # comments at the end are left as they are
+                head.extend(tokens[idx:])
+                break
+            start = len(head)
+            head.extend(tokens[idx:eidx])
+            _group_tokens_in(tlist, head, sql.Comment, start, len(head) - 1,
+                             False)
+            grouped = True
+            idx = eidx
+            continue
+        head.append(token)
+        idx += 1
 
-        tidx, token = tlist.token_next_by(t=T.Comment, idx=tidx)
+    if grouped:
+        tlist.tokens = head
+        tlist._positions = None
 
 
 @recurse(sql.Where)
@@ -323,12 +445,12 @@ def group_aliased(tlist):
     I_ALIAS = (sql.Parenthesis, sql.Function, sql.Case, sql.Identifier,
                sql.Operation, sql.Comparison)
 
-    tidx, token = tlist.token_next_by(i=I_ALIAS, t=T.Number)
-    while token:
-        nidx, next_ = tlist.token_next(tidx)
-        if isinstance(next_, sql.Identifier):
-            tlist.group_tokens(sql.Identifier, tidx, nidx, extend=True)
-        tidx, token = tlist.token_next_by(i=I_ALIAS, t=T.Number, idx=tidx)
+    match = Matcher(i=I_ALIAS, t=T.Number)
+
+    def valid_next(token):
+        return isinstance(token, sql.Identifier)
+
+    _group_next(tlist, sql.Identifier, match, valid_next, extend=True)
 
 
 @recurse(sql.Function)
@@ -336,6 +458,9 @@ def group_functions(tlist):
     has_create = False
     has_table = False
     for tmp_token in tlist.tokens:
+        # the value of groups would be joined for nothing
+        if tmp_token.is_group:
+            continue
         if tmp_token.value == 'CREATE':
             has_create = True
         if tmp_token.value == 'TABLE':
@@ -343,34 +468,30 @@ def group_functions(tlist):
     if has_create and has_table:
         return
 
-    tidx, token = tlist.token_next_by(t=T.Name)
-    while token:
-        nidx, next_ = tlist.token_next(tidx)
-        if isinstance(next_, sql.Parenthesis):
-            tlist.group_tokens(sql.Function, tidx, nidx)
-        tidx, token = tlist.token_next_by(t=T.Name, idx=tidx)
+    match = Matcher(t=T.Name)
+
+    def valid_next(token):
+        return isinstance(token, sql.Parenthesis)
+
+    _group_next(tlist, sql.Function, match, valid_next)
 
 
 def group_order(tlist):
     """Group together Identifier and Asc/Desc token"""
-    tidx, token = tlist.token_next_by(t=T.Keyword.Order)
-    while token:
-        pidx, prev_ = tlist.token_prev(tidx)
-        if imt(prev_, i=sql.Identifier, t=T.Number):
-            tlist.group_tokens(sql.Identifier, pidx, tidx)
-            tidx = pidx
-        tidx, token = tlist.token_next_by(t=T.Keyword.Order, idx=tidx)
+    match = Matcher(t=T.Keyword.Order)
+    valid_prev = Matcher(i=sql.Identifier, t=T.Number)
+    _group_prev(tlist, sql.Identifier, match, valid_prev)
 
 
 @recurse()
 def align_comments(tlist):
-    tidx, token = tlist.token_next_by(i=sql.Comment)
-    while token:
-        pidx, prev_ = tlist.token_prev(tidx)
-        if isinstance(prev_, sql.TokenList):
-            tlist.group_tokens(sql.TokenList, pidx, tidx, extend=True)
-            tidx = pidx
-        tidx, token = tlist.token_next_by(i=sql.Comment, idx=tidx)
+    def match(token):
+        return isinstance(token, sql.Comment)
+
+    def valid_prev(token):
+        return isinstance(token, sql.TokenList)
+
+    _group_prev(tlist, sql.TokenList, match, valid_prev, extend=True)
 
 
 def group_values(tlist):
@@ -385,41 +506,197 @@ def group_values(tlist):
         tlist.group_tokens(sql.Values, start_idx, end_idx, extend=True)
 
 
-def group(stmt):
-    for func in [
-        group_comments,
-
-        # _group_matching
-        group_brackets,
-        group_parenthesis,
-        group_case,
-        group_if,
-        group_for,
-        group_begin,
-
-        group_functions,
-        group_where,
-        group_period,
-        group_arrays,
-        group_identifier,
-        group_order,
-        group_typecasts,
-        group_tzcasts,
-        group_typed_literal,
-        group_operator,
-        group_comparison,
-        group_as,
-        group_aliased,
-        group_assignment,
-
-        align_comments,
-        group_identifier_list,
-        group_values,
-    ]:
-        func(stmt)
+# The passes of group() in order. group_matching does the passes of
+# MATCHING in one scan, it's run instead of them when all are selected.
+PASSES = (
+    group_comments,
+
+    group_matching,
+    group_brackets,
+    group_parenthesis,
+    group_case,
+    group_if,
+    group_for,
+    group_begin,
+
+    group_functions,
+    group_where,
+    group_period,
+    group_arrays,
+    group_identifier,
+    group_order,
+    group_typecasts,
+    group_tzcasts,
+    group_typed_literal,
+    group_operator,
+    group_comparison,
+    group_as,
+    group_aliased,
+    group_assignment,
+
+    align_comments,
+    group_identifier_list,
+    group_values,
+)
+
+# The passes that must run before a pass: the ones making the groups it
+# looks for or extends. Blocks are matched inside the groups of the
+# classes before them in MATCHING.
+REQUIRES = {
+    group_parenthesis: (group_brackets,),
+    group_case: (group_parenthesis,),
+    group_if: (group_case,),
+    group_for: (group_if,),
+    group_begin: (group_for,),
+    group_functions: (group_parenthesis,),
+    group_where: (group_begin,),
+    group_period: (group_brackets, group_functions),
+    group_arrays: (group_period,),
+    group_identifier: (group_arrays,),
+    group_order: (group_identifier,),
+    group_typecasts: (group_identifier,),
+    group_tzcasts: (group_identifier,),
+    group_operator: (group_order, group_typecasts, group_tzcasts,
+                     group_typed_literal),
+    group_comparison: (group_operator,),
+    group_as: (group_begin, group_comparison),
+    group_aliased: (group_as,),
+    group_assignment: (group_aliased,),
+    align_comments: (group_comments, group_assignment),
+    group_identifier_list: (align_comments,),
+    group_values: (group_parenthesis,),
+}
+
+# Named sets of passes for resolve_passes(), the passes they require are
+# added to them.
+LEVELS = {
+    # brackets, parenthesis and blocks like CASE ... END
+    'blocks': (group_matching,),
+    # identifiers with their aliases and lists of them, enough for tables
+    # and for Statement.get_type() of statements starting with WITH
+    'identifiers': (group_identifier_list,),
+    'full': PASSES,
+}
+
+
+def resolve_passes(passes):
+    """Returns the passes to run for *passes*.
+
+    :param passes: A level of :data:`LEVELS`, a pass of :data:`PASSES`
+      or an iterable of them, passes given as functions or by their names.
+    :returns: A frozenset of passes for :func:`group`, including the
+      passes they require.
+    """
+    names = dict((func.__name__, func) for func in PASSES)
+    if isinstance(passes, string_types):
+        if passes in LEVELS:
+            passes = LEVELS[passes]
+        elif passes in names:
+            passes = (passes,)
+        else:
+            raise SQLParseError(
+                'Unknown grouping level or pass: {0!r}'.format(passes))
+    elif callable(passes):
+        passes = (passes,)
+
+    try:
+        passes = list(passes)
+    except TypeError:
+        raise SQLParseError('Expected a grouping level or passes, '
+                            'got {0!r}'.format(passes))
+
+    todo = []
+    for func in passes:
+        func = names.get(func, func)
+        if func not in PASSES:
+            raise SQLParseError('Unknown grouping pass: {0!r}'.format(func))
+        todo.append(func)
+
+    resolved = set()
+    while todo:
+        func = todo.pop()
+        if func is group_matching:
+            todo.extend(matching for _, matching in MATCHING)
+        elif func not in resolved:
+            resolved.add(func)
+            todo.extend(REQUIRES.get(func, ()))
+
+    matching = set(func for _, func in MATCHING)
+    if matching <= resolved:
+        resolved = (resolved - matching) | set([group_matching])
+    return frozenset(resolved)
+
+
+FULL = resolve_passes('full')
+
+
+def group(stmt, passes=None):
+    """Groups the tokens of *stmt*.
+
+    :param passes: The passes to run as returned by
+      :func:`resolve_passes`, all passes if ``None``.
+    """
+    if passes is None:
+        passes = FULL
+    summary = getattr(stmt, 'summary', None)
+    for func in PASSES:
+        if func not in passes:
+            continue
+        if summary is None or _is_triggered(func, summary):
+            func(stmt)
     return stmt
 
 
+def _trigger(types=(), values=()):
+    bits = 0
+    for ttype in types:
+        bits |= ttype.bit
+    return bits, frozenset(values)
+
+
+# A pass can only group something if the statement has a token of one of
+# the types or with one of the keyword or punctuation values.
+TRIGGERS = {
+    group_comments: _trigger(types=(T.Comment,)),
+    group_brackets: _trigger(values=('[',)),
+    group_parenthesis: _trigger(values=('(',)),
+    group_case: _trigger(values=('CASE',)),
+    group_if: _trigger(values=('IF',)),
+    group_for: _trigger(values=('FOR', 'FOREACH')),
+    group_begin: _trigger(values=('BEGIN',)),
+    group_matching: _trigger(values=(
+        '[', '(', 'CASE', 'IF', 'FOR', 'FOREACH', 'BEGIN')),
+    group_functions: _trigger(values=('(',)),
+    group_where: _trigger(values=('WHERE',)),
+    group_period: _trigger(values=('.',)),
+    group_arrays: _trigger(values=('[',)),
+    group_identifier: _trigger(types=(T.Name, T.String.Symbol)),
+    group_order: _trigger(types=(T.Keyword.Order,)),
+    group_typecasts: _trigger(values=('::',)),
+    group_tzcasts: _trigger(types=(T.Keyword.TZCast,)),
+    group_typed_literal: _trigger(types=(T.Name.Builtin,),
+                                  values=('TIMESTAMP',)),
+    group_operator: _trigger(types=(T.Operator, T.Wildcard)),
+    group_comparison: _trigger(types=(T.Operator.Comparison,)),
+    group_as: _trigger(values=('AS',)),
+    group_assignment: _trigger(types=(T.Assignment,)),
+    align_comments: _trigger(types=(T.Comment,)),
+    group_identifier_list: _trigger(values=(',',)),
+    group_values: _trigger(values=('VALUES',)),
+}
+
+
+def _is_triggered(func, summary):
+    """Returns ``False`` if *func* can't group anything in a statement
+    with the summary ``(type_bits, values)``."""
+    try:
+        bits, values = TRIGGERS[func]
+    except KeyError:
+        return True
+    type_bits, stmt_values = summary
+    return bool(type_bits & bits) or not values.isdisjoint(stmt_values)
+
+
 def _group(tlist, cls, match,
            valid_prev=lambda t: True,
            valid_next=lambda t: True,
@@ -427,27 +704,144 @@ def _group(tlist, cls, match,
            extend=True,
            recurse=True
            ):
-    """Groups together tokens that are joined by a middle token. i.e. x < y"""
-
-    tidx_offset = 0
+    """Groups together tokens that are joined by a middle token. i.e. x < y
+
+    The grouped list is built in one forward sweep: while scanning, the
+    tokens of *tlist* are ``head + tokens[consumed:]`` and groups are made
+    at the end of *head*. The indexes passed to *post* are indexes of the
+    unchanged *tokens*, shifted by the number of tokens grouped so far, so
+    *post* may look at the tokens from *tidx* on.
+    """
+    # The groups in tlist don't depend on how it's grouped, so they're
+    # done first, without recursion.
+    for sgroup in bottom_up(tlist, cls) if recurse else [tlist]:
+        _group_list(sgroup, cls, match, valid_prev, valid_next, post, extend)
+
+
+def _group_list(tlist, cls, match, valid_prev, valid_next, post, extend):
+    tokens = tlist.tokens
+    head, consumed = [], 0
+    # Set when falling back to grouping in place
+    tidx_offset = None
     pidx, prev_ = None, None
-    for idx, token in enumerate(list(tlist)):
-        tidx = idx - tidx_offset
+    for idx, token in enumerate(tokens):
+        if tidx_offset is None:
+            tidx = idx - consumed + len(head)
+        else:
+            tidx = idx - tidx_offset
 
         if token.is_whitespace:
             continue
 
-        if recurse and token.is_group and not isinstance(token, cls):
-            _group(token, cls, match, valid_prev, valid_next, post, extend)
-
         if match(token):
-            nidx, next_ = tlist.token_next(tidx)
+            if tidx_offset is None and idx < consumed:
+                # The token is inside a group made before, so tidx is not
+                # its index. Group the tokens as they are from here on.
+                tidx_offset = _group_in_place(tlist, head, consumed)
+            if tidx_offset is None:
+                head.extend(tokens[consumed:idx])
+                consumed = idx
+                shift = idx - tidx
+            else:
+                shift = 0
+
+            nidx, next_ = tlist.token_next(tidx + shift)
             if prev_ and valid_prev(prev_) and valid_next(next_):
-                from_idx, to_idx = post(tlist, pidx, tidx, nidx)
-                grp = tlist.group_tokens(cls, from_idx, to_idx, extend=extend)
+                from_idx, to_idx = post(tlist, pidx + shift, tidx + shift,
+                                        nidx)
+                from_idx -= shift
+                to_idx -= shift
+                if tidx_offset is None and not (
+                        0 <= from_idx <= tidx <= to_idx):
+                    tidx_offset = _group_in_place(tlist, head, consumed)
+
+                if tidx_offset is None:
+                    count = to_idx - len(head) + 1
+                    head.extend(tokens[consumed:consumed + count])
+                    consumed += count
+                    grp = _group_tokens_in(tlist, head, cls, from_idx,
+                                           to_idx, extend)
+                else:
+                    grp = tlist.group_tokens(cls, from_idx, to_idx,
+                                             extend=extend)
+                    tidx_offset += to_idx - from_idx
 
-                tidx_offset += to_idx - from_idx
                 pidx, prev_ = from_idx, grp
                 continue
 
         pidx, prev_ = tidx, token
+
+    if tidx_offset is None and head:
+        head.extend(tokens[consumed:])
+        tlist.tokens = head
+        tlist._positions = None
+
+
+def _group_in_place(tlist, head, consumed):
+    """Makes ``head + tokens[consumed:]`` the tokens of *tlist* and returns
+    the number of tokens grouped so far."""
+    tokens = tlist.tokens
+    tlist.tokens = head + tokens[consumed:]
+    tlist._positions = None
+    return consumed - len(head)
+
+
+def _group_next(tlist, cls, match, valid_next, extend=False):
+    """Groups each token that matches together with the next token, if that
+    is valid. Whitespace between them is skipped.
+
+    Like :func:`_group`, the grouped list is built in one forward sweep.
+    """
+    tokens = tlist.tokens
+    head = []
+    idx = 0
+    while idx < len(tokens):
+        token = tokens[idx]
+        if match(token):
+            nidx, next_ = tlist.token_next(idx)
+            if valid_next(next_):
+                start = len(head)
+                head.extend(tokens[idx:nidx + 1])
+                _group_tokens_in(tlist, head, cls, start, len(head) - 1,
+                                 extend)
+                idx = nidx + 1
+                continue
+        head.append(token)
+        idx += 1
+
+    if len(head) != len(tokens):
+        tlist.tokens = head
+        tlist._positions = None
+
+
+def _group_prev(tlist, cls, match, valid_prev, extend=False):
+    """Groups each token that matches together with the previous token, if
+    that is valid. Whitespace between them is skipped.
+
+    Like :func:`_group`, the grouped list is built in one forward sweep.
+    """
+    tokens = tlist.tokens
+    head = []
+    # Index of the last token in head that isn't whitespace
+    pidx = None
+    for token in tokens:
+        head.append(token)
+        if match(token) and pidx is not None and valid_prev(head[pidx]):
+            _group_tokens_in(tlist, head, cls, pidx, len(head) - 1, extend)
+        elif not token.is_whitespace:
+            pidx = len(head) - 1
+
+    if len(head) != len(tokens):
+        tlist.tokens = head
+        tlist._positions = None
+
+
+def _group_tokens_in(tlist, tokens, cls, start, end, extend):
+    """Calls ``tlist.group_tokens`` on the list *tokens* instead of the
+    tokens of *tlist*, keeping them as they are."""
+    tlist_tokens = tlist.tokens
+    tlist.tokens = tokens
+    try:
+        return tlist.group_tokens(cls, start, end, extend=extend)
+    finally:
+        tlist.tokens = tlist_tokens
@@ -25,6 +25,10 @@ class StatementSplitter(object):
         self.tokens = []
         self.level = 0
 
+        # summary of the statement, see sql.Statement.summary
+        self.type_bits = 0
+        self.values = set()
+
     def _change_splitlevel(self, ttype, value):
         """Get the new split level (increase, decrease or remain equal)"""
 
@@ -88,7 +92,7 @@ class StatementSplitter(object):
             # whitespace ignores newlines.
             # why don't multi line comments also count?
             if self.consume_ws and ttype not in EOS_TTYPE:
-                yield sql.Statement(self.tokens)
+                yield self._statement()
 
                 # Reset filter and prepare to process next statement
                 self._reset()
@@ -97,7 +101,11 @@ class StatementSplitter(object):
             self.level += self._change_splitlevel(ttype, value)
 
             # Append the token to the current statement
-            self.tokens.append(sql.Token(ttype, value))
+            token = sql.Token(ttype, value)
+            self.tokens.append(token)
+            self.type_bits |= ttype.ancestors
+            if token.is_keyword or ttype is T.Punctuation:
+                self.values.add(token.normalized)
 
             # Check if we get the end of a statement
             if self.level <= 0 and ttype is T.Punctuation and value == ';':
@@ -105,4 +113,56 @@ class StatementSplitter(object):
 
         # Yield pending statement (if any)
         if self.tokens:
-            yield sql.Statement(self.tokens)
+            yield self._statement()
+
+    def _statement(self):
+        stmt = sql.Statement(self.tokens)
+        stmt.summary = self.type_bits, self.values
+        return stmt
+
+    def split_table(self, table):
+        """Split a :class:`~sqlparse.sql.TokenTable` at statements.
+
+        No tokens are created, only the values needed to find the end of
+        statements are copied out of the table's source. While a pair is
+        processed, ``type_bits`` and ``values`` hold the summary of the
+        statement.
+
+        :returns: A generator of ``(first, stop)`` pairs, the statement
+          consists of the tokens with the indexes ``first`` to ``stop - 1``.
+        """
+        EOS_TTYPE = T.Whitespace, T.Comment.Single
+        source = table.source
+        first = 0
+        for idx, (ttype, start, end) in enumerate(table.spans()):
+            if self.consume_ws and ttype not in EOS_TTYPE:
+                yield first, idx
+                self._reset()
+                first = idx
+
+            # only punctuation and keywords have an effect on the split level
+            value = source[start:end] \
+                if ttype is T.Punctuation or ttype in T.Keyword else None
+            self.level += self._change_splitlevel(ttype, value)
+            self.type_bits |= ttype.ancestors
+            if value is not None:
+                self.values.add(value.upper())
+
+            if self.level <= 0 and ttype is T.Punctuation and value == ';':
+                self.consume_ws = True
+
+        if first < len(table):
+            yield first, len(table)
+
+    def process_table(self, table):
+        """Process a :class:`~sqlparse.sql.TokenTable` into statements.
+
+        Tokens and statements are created by ``from_span()`` and reference
+        the table's source.
+        """
+        for first, stop in self.split_table(table):
+            tokens = [table[idx] for idx in range(first, stop)]
+            start, end = tokens[0].start, tokens[-1].end
+            stmt = sql.Statement.from_span(tokens, table.source, start, end)
+            stmt.summary = self.type_bits, self.values
+            yield stmt
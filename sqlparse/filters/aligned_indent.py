@@ -8,7 +8,7 @@
 
 from sqlparse import sql, tokens as T
 from sqlparse.compat import text_type
-from sqlparse.utils import offset, indent
+from sqlparse.utils import offset, indent, process_depth_first
 
 
 class AlignedIndentFilter(object):
@@ -45,7 +45,7 @@ class AlignedIndentFilter(object):
             tlist.tokens.pop(0)
 
         # process the main query body
-        self._process(sql.TokenList(tlist.tokens))
+        yield sql.TokenList(tlist.tokens)
 
     def _process_parenthesis(self, tlist):
         # if this isn't a subquery, don't re-indent
@@ -54,7 +54,8 @@ class AlignedIndentFilter(object):
             with indent(self):
                 tlist.insert_after(tlist[0], self.nl('SELECT'))
                 # process the inside of the parenthesis
-                self._process_default(tlist)
+                for sgroup in self._process_default(tlist):
+                    yield sgroup
 
             # de-indent last parenthesis
             tlist.insert_before(tlist[-1], self.nl())
@@ -64,7 +65,7 @@ class AlignedIndentFilter(object):
         identifiers = list(tlist.get_identifiers())
         identifiers.pop(0)
         [tlist.insert_before(token, self.nl()) for token in identifiers]
-        self._process_default(tlist)
+        return self._process_default(tlist)
 
     def _process_case(self, tlist):
         offset_ = len('case ') + len('when ')
@@ -126,12 +127,16 @@ class AlignedIndentFilter(object):
                 prev_ and prev_.match(T.Keyword, self.by_words, regex=True)
             ) else 0
             with offset(self, offset_):
-                self._process(sgroup)
+                yield sgroup
 
     def _process(self, tlist):
+        process_depth_first(self._process_group, tlist)
+
+    def _process_group(self, tlist):
+        # The _process_* methods yield the groups to process next.
         func_name = '_process_{cls}'.format(cls=type(tlist).__name__)
         func = getattr(self, func_name.lower(), self._process_default)
-        func(tlist)
+        return func(tlist)
 
     def process(self, stmt):
         self._process(stmt)
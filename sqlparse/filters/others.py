@@ -7,7 +7,7 @@
 # the BSD License: https://opensource.org/licenses/BSD-3-Clause
 
 from sqlparse import sql, tokens as T
-from sqlparse.utils import split_unquoted_newlines
+from sqlparse.utils import bottom_up, split_unquoted_newlines
 
 
 class StripCommentsFilter(object):
@@ -40,8 +40,8 @@ class StripCommentsFilter(object):
             tidx, token = get_next_comment()
 
     def process(self, stmt):
-        [self.process(sgroup) for sgroup in stmt.get_sublists()]
-        StripCommentsFilter._process(stmt)
+        for tlist in bottom_up(stmt):
+            StripCommentsFilter._process(tlist)
         return stmt
 
 
@@ -82,10 +82,10 @@ class StripWhitespaceFilter(object):
             tlist.tokens.pop(-2)
         self._stripws_default(tlist)
 
-    def process(self, stmt, depth=0):
-        [self.process(sgroup, depth + 1) for sgroup in stmt.get_sublists()]
-        self._stripws(stmt)
-        if depth == 0 and stmt.tokens and stmt.tokens[-1].is_whitespace:
+    def process(self, stmt):
+        for tlist in bottom_up(stmt):
+            self._stripws(tlist)
+        if stmt.tokens and stmt.tokens[-1].is_whitespace:
             stmt.tokens.pop(-1)
         return stmt
 
@@ -110,8 +110,8 @@ class SpacesAroundOperatorsFilter(object):
             tidx, token = tlist.token_next_by(t=ttypes, idx=tidx)
 
     def process(self, stmt):
-        [self.process(sgroup) for sgroup in stmt.get_sublists()]
-        SpacesAroundOperatorsFilter._process(stmt)
+        for tlist in bottom_up(stmt):
+            SpacesAroundOperatorsFilter._process(tlist)
         return stmt
 
 
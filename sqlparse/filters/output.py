@@ -28,9 +28,30 @@ class OutputFilter(object):
             varname = self.varname
 
         has_nl = len(text_type(stmt).strip().splitlines()) > 1
-        stmt.tokens = self._process(stmt.tokens, varname, has_nl)
+        # newlines may be inside of groups, e.g. added by reindenting
+        tokens = self._strip_line_ends(stmt.flatten())
+        stmt.tokens = self._process(tokens, varname, has_nl)
         return stmt
 
+    @staticmethod
+    def _strip_line_ends(stream):
+        """Drops the whitespace before line breaks.
+
+        A quoted line ends with a space standing in for the line break.
+        Reindenting leaves whitespace before the line breaks it adds, which
+        would be quoted as well. Like the serializer of plain output, it's
+        dropped so the quoted lines joined are the plain output with single
+        spaces instead of line breaks.
+        """
+        tokens = []
+        for token in stream:
+            if token.is_whitespace and '\n' in token.value:
+                while tokens and tokens[-1].is_whitespace \
+                        and '\n' not in tokens[-1].value:
+                    tokens.pop()
+            tokens.append(token)
+        return tokens
+
 
 class OutputPythonFilter(OutputFilter):
     def _process(self, stream, varname, has_nl):
@@ -8,7 +8,7 @@
 
 from sqlparse import sql, tokens as T
 from sqlparse.compat import text_type
-from sqlparse.utils import offset, indent
+from sqlparse.utils import offset, indent, process_depth_first
 
 
 class ReindentFilter(object):
@@ -26,6 +26,8 @@ class ReindentFilter(object):
         self._curr_stmt = None
         self._last_stmt = None
         self._last_func = None
+        # Maps ids of tokens to the token and its column
+        self._columns = {}
 
     def _flatten_up_to_token(self, token):
         """Yields all tokens up to token but excluding current."""
@@ -37,17 +39,77 @@ class ReindentFilter(object):
                 break
             yield t
 
+    def _tokens_before(self, token):
+        """Yields the ungrouped tokens before token, the closest first."""
+        # The parents are only looked at when their tokens are needed, the
+        # caller mostly stops at the line break before token.
+        count = 0
+        child = token
+        while child.parent is not None:
+            parent = child.parent
+            try:
+                idx = parent.token_index(child)
+            except ValueError:
+                # a parent that doesn't hold its child anymore
+                tokens = list(self._flatten_up_to_token(token))
+                for t in reversed(tokens[:len(tokens) - count]):
+                    yield t
+                return
+            child = parent
+            if idx == 0:
+                continue
+            stack = [(t for _, t in parent.token_scan(idx - 1, None, True))]
+            while stack:
+                for t in stack[-1]:
+                    if t.is_group:
+                        stack.append(reversed(t.tokens))
+                        break
+                    count += 1
+                    yield t
+                else:
+                    stack.pop()
+
     @property
     def leading_ws(self):
         return self.offset + self.indent * self.width
 
     def _get_offset(self, token):
-        raw = u''.join(map(text_type, self._flatten_up_to_token(token)))
-        line = (raw or '\n').splitlines()[-1]
+        # Only the line of token matters, so the text before it is
+        # collected backwards up to a line break, or up to a token whose
+        # column is known from an earlier call.
+        chunks = []
+        column = None
+        for t in self._tokens_before(token):
+            known = self._columns.get(id(t))
+            if known is not None and known[0] is t:
+                after = t.value + u''.join(reversed(chunks))
+                if after and after.splitlines() == [after]:
+                    column = known[1] + len(after)
+                    break
+            chunks.append(t.value)
+            if t.value.splitlines() != [t.value] \
+                    and len(u''.join(reversed(chunks)).splitlines()) > 1:
+                break
+
+        if column is None:
+            raw = u''.join(reversed(chunks))
+            width = len((raw or '\n').splitlines()[-1])
+            last = raw.splitlines(True)[-1] if raw else raw
+            column = 0 if last.splitlines() != [last] else len(last)
+        else:
+            width = column
+
+        # The tokens processed later are behind this one, so its column
+        # doesn't change anymore.
+        first = next(token.flatten()) if token.is_group else token
+        self._columns[id(first)] = first, column
+
         # Now take current offset into account and return relative offset.
-        return len(line) - len(self.char * self.leading_ws)
+        return width - len(self.char * self.leading_ws)
 
     def nl(self, offset=0):
+        # the new line moves the tokens behind it
+        self._columns.clear()
         return sql.Token(
             T.Whitespace,
             self.n + self.char * max(0, self.leading_ws + offset))
@@ -75,6 +137,7 @@ class ReindentFilter(object):
 
             if prev_ and prev_.is_whitespace:
                 del tlist.tokens[pidx]
+                self._columns.clear()
                 tidx -= 1
 
             if not (uprev.endswith('\n') or uprev.endswith('\r')):
@@ -98,9 +161,13 @@ class ReindentFilter(object):
             tidx, token = tlist.token_next_by(t=ttypes, idx=tidx)
 
     def _process(self, tlist):
+        process_depth_first(self._process_group, tlist)
+
+    def _process_group(self, tlist):
+        # The _process_* methods yield the groups to process next.
         func_name = '_process_{cls}'.format(cls=type(tlist).__name__)
         func = getattr(self, func_name.lower(), self._process_default)
-        func(tlist)
+        return func(tlist)
 
     def _process_where(self, tlist):
         tidx, token = tlist.token_next_by(m=(T.Keyword, 'WHERE'))
@@ -108,7 +175,8 @@ class ReindentFilter(object):
         tlist.insert_before(tidx, self.nl())
 
         with indent(self):
-            self._process_default(tlist)
+            for sgroup in self._process_default(tlist):
+                yield sgroup
 
     def _process_parenthesis(self, tlist):
         ttypes = T.Keyword.DML, T.Keyword.DDL
@@ -118,11 +186,12 @@ class ReindentFilter(object):
         with indent(self, 1 if is_dml_dll else 0):
             tlist.tokens.insert(0, self.nl()) if is_dml_dll else None
             with offset(self, self._get_offset(first) + 1):
-                self._process_default(tlist, not is_dml_dll)
+                for sgroup in self._process_default(tlist, not is_dml_dll):
+                    yield sgroup
 
     def _process_function(self, tlist):
         self._last_func = tlist[0]
-        self._process_default(tlist)
+        return self._process_default(tlist)
 
     def _process_identifierlist(self, tlist):
         identifiers = list(tlist.get_identifiers())
@@ -165,6 +234,7 @@ class ReindentFilter(object):
                 if token.value == ',' and not next_ws.is_whitespace:
                     tlist.insert_after(
                         token, sql.Token(T.Whitespace, ' '))
+                    self._columns.clear()
 
             end_at = self.offset + sum(len(i.value) + 1 for i in identifiers)
             adjusted_offset = 0
@@ -185,7 +255,8 @@ class ReindentFilter(object):
                         adjust = 0
                         tlist.insert_before(token, self.nl(offset=adjust))
                         position = 0
-        self._process_default(tlist)
+        for sgroup in self._process_default(tlist):
+            yield sgroup
 
     def _process_case(self, tlist):
         iterable = iter(tlist.get_cases())
@@ -201,7 +272,8 @@ class ReindentFilter(object):
                 # Line breaks on group level are done. let's add an offset of
                 # len "when ", "then ", "else "
                 with offset(self, len("WHEN ")):
-                    self._process_default(tlist)
+                    for sgroup in self._process_default(tlist):
+                        yield sgroup
             end_idx, end = tlist.token_next_by(m=sql.Case.M_CLOSE)
             if end_idx is not None:
                 tlist.insert_before(end_idx, self.nl())
@@ -227,10 +299,11 @@ class ReindentFilter(object):
         self._split_statements(tlist) if stmts else None
         self._split_kwds(tlist)
         for sgroup in tlist.get_sublists():
-            self._process(sgroup)
+            yield sgroup
 
     def process(self, stmt):
         self._curr_stmt = stmt
+        self._columns = {}
         self._process(stmt)
 
         if self._last_stmt is not None:
@@ -9,11 +9,17 @@
 """SQL formatter"""
 
 from sqlparse import filters
+from sqlparse.keywords import DIALECTS
 from sqlparse.exceptions import SQLParseError
 
 
 def validate_options(options):
     """Validates options."""
+    dialect = options.get('dialect')
+    if dialect is not None and dialect not in DIALECTS:
+        raise SQLParseError('Unknown dialect: '
+                            '{0!r}'.format(dialect))
+
     kwcase = options.get('keyword_case')
     if kwcase not in [None, 'upper', 'lower', 'capitalize']:
         raise SQLParseError('Invalid value for keyword_case: '
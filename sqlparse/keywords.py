@@ -9,24 +9,58 @@
 import re
 
 from sqlparse import tokens
-
-
-def is_keyword(value):
-    val = value.upper()
-    return (KEYWORDS_COMMON.get(val)
-            or KEYWORDS_ORACLE.get(val)
-            or KEYWORDS_PLPGSQL.get(val)
-            or KEYWORDS_HQL.get(val)
-            or KEYWORDS.get(val, tokens.Name)), value
+from sqlparse.exceptions import SQLParseError
+
+
+def keyword_lookup(keywords):
+    """Return a lexer action looking up words in the dictionary *keywords*.
+
+    Words that aren't keywords are names.
+    """
+    cache = {}
+
+    def lookup(value):
+        result = cache.get(value)
+        if result is None:
+            # Words are mostly repeated identifiers, remember the result for
+            # them as they are instead of upper-casing them again.
+            if len(cache) >= KEYWORD_CACHE_SIZE:
+                cache.clear()
+            result = keywords.get(value.upper(), tokens.Name), value
+            cache[value] = result
+        return result
+    lookup.cache = cache
+    lookup.keywords = keywords
+    return lookup
+
+
+# Filled in at the end of the module, see rebuild_keywords()
+KEYWORDS_ALL = {}
+is_keyword = keyword_lookup(KEYWORDS_ALL)
+
+
+# Rules of SQL_REGEX referred to by DIALECT_RULES and DELIMITED_RULES
+RX_HINT_MULTILINE = r'/\*\+[\s\S]*?\*/'
+RX_COMMENT_MULTILINE = r'/\*[\s\S]*?\*/'
+RX_BACKTICK_NAME = r"`(``|[^`])*`"
+RX_ACUTE_NAME = r"´(´´|[^´])*´"
+# a named group is used as rules are combined by the lexer
+RX_DOLLAR_QUOTED = r'(?P<tag>(?<!\S)\$(?:[_A-ZÀ-Ü]\w*)?\$)[\s\S]*?(?P=tag)'
+RX_STRING_SINGLE = r"'(''|\\\\|\\'|[^'])*'"
+RX_STRING_SYMBOL = r'"(""|\\\\|\\"|[^"])*"'
+RX_STRING_SYMBOL_LAZY = r'(""|".*?[^\\]")'
+RX_BRACKET_NAME = r'(?<![\w\])])(\[[^\]]+\])'
+RX_LATERAL_VIEW = (r'(LATERAL\s+VIEW\s+)'
+                   r'(EXPLODE|INLINE|PARSE_URL_TUPLE|POSEXPLODE|STACK)\b')
 
 
 SQL_REGEX = {
     'root': [
         (r'(--|# )\+.*?(\r\n|\r|\n|$)', tokens.Comment.Single.Hint),
-        (r'/\*\+[\s\S]*?\*/', tokens.Comment.Multiline.Hint),
+        (RX_HINT_MULTILINE, tokens.Comment.Multiline.Hint),
 
         (r'(--|# ).*?(\r\n|\r|\n|$)', tokens.Comment.Single),
-        (r'/\*[\s\S]*?\*/', tokens.Comment.Multiline),
+        (RX_COMMENT_MULTILINE, tokens.Comment.Multiline),
 
         (r'(\r\n|\r|\n)', tokens.Newline),
         (r'\s+?', tokens.Whitespace),
@@ -36,9 +70,9 @@ SQL_REGEX = {
 
         (r'\*', tokens.Wildcard),
 
-        (r"`(``|[^`])*`", tokens.Name),
-        (r"´(´´|[^´])*´", tokens.Name),
-        (r'((?<!\S)\$(?:[_A-ZÀ-Ü]\w*)?\$)[\s\S]*?\1', tokens.Literal),
+        (RX_BACKTICK_NAME, tokens.Name),
+        (RX_ACUTE_NAME, tokens.Name),
+        (RX_DOLLAR_QUOTED, tokens.Literal),
 
         (r'\?', tokens.Name.Placeholder),
         (r'%(\(\w+\))?s', tokens.Name.Placeholder),
@@ -67,14 +101,14 @@ SQL_REGEX = {
         (r'(?![_A-ZÀ-Ü])-?(\d+(\.\d*)|\.\d+)(?![_A-ZÀ-Ü])',
          tokens.Number.Float),
         (r'(?![_A-ZÀ-Ü])-?\d+(?![_A-ZÀ-Ü])', tokens.Number.Integer),
-        (r"'(''|\\\\|\\'|[^'])*'", tokens.String.Single),
+        (RX_STRING_SINGLE, tokens.String.Single),
         # not a real string literal in ANSI SQL:
-        (r'"(""|\\\\|\\"|[^"])*"', tokens.String.Symbol),
-        (r'(""|".*?[^\\]")', tokens.String.Symbol),
+        (RX_STRING_SYMBOL, tokens.String.Symbol),
+        (RX_STRING_SYMBOL_LAZY, tokens.String.Symbol),
         # sqlite names can be escaped with [square brackets]. left bracket
         # cannot be preceded by word character or a right bracket --
         # otherwise it's probably an array index
-        (r'(?<![\w\])])(\[[^\]]+\])', tokens.Name),
+        (RX_BRACKET_NAME, tokens.Name),
         (r'((LEFT\s+|RIGHT\s+|FULL\s+)?(INNER\s+|OUTER\s+|STRAIGHT\s+)?'
          r'|(CROSS\s+|NATURAL\s+)?)?JOIN\b', tokens.Keyword),
         (r'END(\s+IF|\s+LOOP|\s+WHILE)?\b', tokens.Keyword),
@@ -85,9 +119,7 @@ SQL_REGEX = {
         (r'DOUBLE\s+PRECISION\b', tokens.Name.Builtin),
         (r'GROUP\s+BY\b', tokens.Keyword),
         (r'ORDER\s+BY\b', tokens.Keyword),
-        (r'(LATERAL\s+VIEW\s+)'
-         r'(EXPLODE|INLINE|PARSE_URL_TUPLE|POSEXPLODE|STACK)\b',
-         tokens.Keyword),
+        (RX_LATERAL_VIEW, tokens.Keyword),
         (r"(AT|WITH')\s+TIME\s+ZONE\s+'[^']+'", tokens.Keyword.TZCast),
         (r'(NOT\s+)?(LIKE|ILIKE)\b', tokens.Operator.Comparison),
         (r'[0-9_A-ZÀ-Ü][_$#\w]*', is_keyword),
@@ -97,7 +129,8 @@ SQL_REGEX = {
     ]}
 
 FLAGS = re.IGNORECASE | re.UNICODE
-SQL_REGEX = [(re.compile(rx, FLAGS).match, tt) for rx, tt in SQL_REGEX['root']]
+SQL_RULES = SQL_REGEX['root']
+SQL_REGEX = [(re.compile(rx, FLAGS).match, tt) for rx, tt in SQL_RULES]
 
 KEYWORDS = {
     'ABORT': tokens.Keyword,
@@ -953,3 +986,105 @@ KEYWORDS_HQL = {
     'BREAK': tokens.Keyword,
     'LEAVE': tokens.Keyword,
 }
+
+KEYWORD_CACHE_SIZE = 10000
+
+# Keyword tables used by a dialect besides KEYWORDS and KEYWORDS_COMMON
+DIALECTS = {
+    'hive': (KEYWORDS_HQL,),
+    'mssql': (),
+    'mysql': (),
+    'oracle': (KEYWORDS_ORACLE,),
+    'postgresql': (KEYWORDS_PLPGSQL,),
+    'sqlite': (),
+}
+
+# Rules of SQL_RULES only tried for some dialects
+DIALECT_RULES = {
+    RX_BACKTICK_NAME: ('hive', 'mysql', 'sqlite'),
+    RX_DOLLAR_QUOTED: ('postgresql',),
+    RX_BRACKET_NAME: ('mssql', 'sqlite'),
+    RX_LATERAL_VIEW: ('hive',),
+}
+
+
+# Rules of SQL_RULES matching literals, comments and quoted names by
+# their opening and closing delimiter. The lexer tries them only if the
+# closing delimiter follows, ``None`` stands for the tag of dollar quotes.
+DELIMITED_RULES = {
+    RX_HINT_MULTILINE: ('/*', '*/'),
+    RX_COMMENT_MULTILINE: ('/*', '*/'),
+    RX_BACKTICK_NAME: ('`', '`'),
+    RX_ACUTE_NAME: ('´', '´'),
+    RX_DOLLAR_QUOTED: (None, None),
+    RX_STRING_SINGLE: ("'", "'"),
+    RX_STRING_SYMBOL: ('"', '"'),
+    RX_STRING_SYMBOL_LAZY: ('"', '"'),
+    RX_BRACKET_NAME: ('[', ']'),
+}
+
+# The tables are keyed by the patterns of rules, a pattern changed only in
+# SQL_REGEX would silently lose its entry.
+assert set(DIALECT_RULES) | set(DELIMITED_RULES) <= set(
+    rx for rx, _ in SQL_RULES), 'rule table key not in SQL_REGEX'
+
+
+def dialect_rules(dialect=None):
+    """Return the rules of SQL_RULES for *dialect*.
+
+    Rules of other dialects are left out and words are looked up in the
+    keywords of *dialect* only. All rules are returned if *dialect* is
+    ``None``.
+    """
+    if dialect is None:
+        return SQL_RULES
+    elif dialect not in DIALECTS:
+        raise SQLParseError('Unknown dialect: {0!r}'.format(dialect))
+
+    lookup = _DIALECT_LOOKUPS.get(dialect)
+    if lookup is None:
+        lookup = keyword_lookup({})
+        _fill_lookup(lookup, dialect)
+        lookup = _DIALECT_LOOKUPS.setdefault(dialect, lookup)
+
+    rules = []
+    for rx, action in SQL_RULES:
+        if dialect in DIALECT_RULES.get(rx, (dialect,)):
+            rules.append((rx, lookup if action is is_keyword else action))
+    return rules
+
+
+# Keyword lookups of dialects handed out by dialect_rules()
+_DIALECT_LOOKUPS = {}
+
+
+def _keyword_tables(dialect=None):
+    """Returns the keyword tables of *dialect*, the last one knowing a word
+    wins. All tables are returned if *dialect* is ``None``."""
+    if dialect is None:
+        return (KEYWORDS, KEYWORDS_HQL, KEYWORDS_PLPGSQL, KEYWORDS_ORACLE,
+                KEYWORDS_COMMON)
+    return (KEYWORDS,) + DIALECTS[dialect] + (KEYWORDS_COMMON,)
+
+
+def _fill_lookup(lookup, dialect=None):
+    lookup.keywords.clear()
+    for table in _keyword_tables(dialect):
+        lookup.keywords.update(table)
+    lookup.cache.clear()
+
+
+def rebuild_keywords():
+    """Rebuild the merged keyword tables after changing one of KEYWORDS,
+    KEYWORDS_COMMON, KEYWORDS_ORACLE, KEYWORDS_PLPGSQL or KEYWORDS_HQL.
+
+    Words are looked up in tables merged from them, :data:`KEYWORDS_ALL`
+    and one per dialect. The merged tables are built once, so changes to
+    the tables they're made of are ignored until they're rebuilt.
+    """
+    _fill_lookup(is_keyword)
+    for dialect, lookup in _DIALECT_LOOKUPS.items():
+        _fill_lookup(lookup, dialect)
+
+
+rebuild_keywords()
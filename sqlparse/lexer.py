@@ -13,10 +13,188 @@
 # It's separated from the rest of pygments to increase performance
 # and to allow some customizations.
 
+import codecs
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import reduce
+from itertools import repeat
+from operator import add, itemgetter
+
 from sqlparse import tokens
-from sqlparse.keywords import SQL_REGEX
-from sqlparse.compat import text_type, file_types
-from sqlparse.utils import consume
+from sqlparse.keywords import (
+    DELIMITED_RULES, FLAGS, dialect_rules)
+from sqlparse.compat import text_type, file_types, unichr
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+def compile_scanner(rules, flags=FLAGS):
+    """Combine ordered ``(regex, action)`` rules into a single scanner.
+
+    Every rule is wrapped in a capturing group and all of them are joined
+    into one alternation. Python tries the branches of an alternation from
+    left to right, so the first rule that matches at a position wins just
+    like when trying the rules one after another. The wrapping group of the
+    winning rule is the outermost one to close, hence ``m.lastindex`` tells
+    which action to apply.
+
+    Backreferences inside of rules must use named groups as the numbering
+    of groups changes when the rules are combined.
+
+    :returns: A 2-tuple of the bound ``match`` method and a dictionary
+      mapping group indexes to actions.
+    """
+    parts = []
+    actions = {}
+    group = 1
+    for rx, action in rules:
+        # native strings like the rules, they aren't text on Python 2
+        parts.append('({0})'.format(rx))
+        actions[group] = action
+        group += 1 + re.compile(rx, flags).groups
+    return re.compile('|'.join(parts), flags).match, actions
+
+
+# Regular expressions implementing the categories of a parsed pattern.
+_CATEGORIES = {
+    'CATEGORY_DIGIT': r'\d',
+    'CATEGORY_NOT_DIGIT': r'\D',
+    'CATEGORY_SPACE': r'\s',
+    'CATEGORY_NOT_SPACE': r'\S',
+    'CATEGORY_WORD': r'\w',
+    'CATEGORY_NOT_WORD': r'\W',
+}
+
+
+def _can_start(pattern, char, flags, chars=None):
+    """Checks whether the parsed *pattern* can match starting with *char*.
+
+    Returns a 2-tuple ``(hit, nullable)``. *nullable* is ``True`` if the
+    pattern may match without consuming any character. Whenever the pattern
+    is not fully understood ``True`` is returned for *hit* to stay on the
+    safe side. *chars* are the cases of *char* to look for.
+    """
+    if chars is None:
+        # e.g. "\xdf".upper() is "SS", re only cares about single characters
+        chars = {c for c in (char, char.lower(), char.upper())
+                 if len(c) == 1} if flags & re.IGNORECASE else {char}
+
+    def in_class(items):
+        for op, av in items:
+            if op is sre_parse.NEGATE:
+                # the char class is inverted
+                return not in_class(items[1:])
+            elif op is sre_parse.LITERAL and unichr(av) in chars:
+                return True
+            elif op is sre_parse.RANGE and any(
+                    av[0] <= ord(c) <= av[1] for c in chars):
+                return True
+            elif op is sre_parse.CATEGORY:
+                rx = _CATEGORIES.get(str(av))
+                if rx is None or re.match(rx, char, flags):
+                    return True
+        return False
+
+    for op, av in pattern:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # zero-width, look at what follows
+            continue
+        elif op is sre_parse.LITERAL:
+            return unichr(av) in chars, False
+        elif op is sre_parse.NOT_LITERAL:
+            return unichr(av) not in chars, False
+        elif op is sre_parse.IN:
+            return in_class(av), False
+        elif op is sre_parse.SUBPATTERN:
+            hit, nullable = _can_start(av[-1], char, flags, chars)
+        elif op is sre_parse.BRANCH:
+            results = [_can_start(p, char, flags, chars) for p in av[1]]
+            hit = any(r[0] for r in results)
+            nullable = any(r[1] for r in results)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            hit, nullable = _can_start(av[2], char, flags, chars)
+            nullable = nullable or av[0] == 0
+        else:
+            return True, False
+
+        if hit or not nullable:
+            return hit, False
+    return False, True
+
+
+def compile_dispatch(rules, flags=FLAGS, delimited=DELIMITED_RULES):
+    """Compile a scanner per leading character.
+
+    Most rules can only match if the text starts with a certain character,
+    e.g. comments need ``-``, ``#`` or ``/``. For each character up to
+    ``\\xff`` only the rules that could start with it are combined (in
+    their original order) by :func:`compile_scanner`. Other characters use
+    a scanner made of all rules.
+
+    Rules in *delimited* can't match unless their closing delimiter follows,
+    see :data:`~sqlparse.keywords.DELIMITED_RULES`. A guard is set up for
+    the leading character of them, holding the opening and closing
+    delimiter and the scanner to use if the latter is missing.
+
+    :returns: A 4-tuple of a dictionary mapping characters to scanners, the
+      scanner for all other characters, a dictionary mapping characters
+      to guards and the ``match`` method of a regular expression matching
+      characters no rule can start with. A scanner is ``None`` if no rule
+      can match.
+    """
+    parsed = [sre_parse.parse(rx, flags) for rx, _ in rules]
+    scanners = {}
+
+    def candidates(char, skip=()):
+        return tuple(
+            idx for idx, pattern in enumerate(parsed)
+            if idx not in skip and any(_can_start(pattern, char, flags)))
+
+    def scanner(candidates):
+        if candidates not in scanners:
+            scanners[candidates] = compile_scanner(
+                [rules[idx] for idx in candidates], flags) \
+                if candidates else None
+        return scanners[candidates]
+
+    table = {}
+    for char in map(unichr, range(256)):
+        table[char] = scanner(candidates(char))
+
+    delimiters = {}
+    for idx, (rx, _) in enumerate(rules):
+        if rx in delimited:
+            opener, closer = delimited[rx]
+            delimiters.setdefault((opener, closer), set()).add(idx)
+    guards = {}
+    for (opener, closer), skip in delimiters.items():
+        char = opener[0] if opener else '$'
+        guards[char] = opener, closer, scanner(candidates(char, skip))
+
+    unmatched = u''.join(re.escape(char) for char in sorted(table)
+                         if table[char] is None and char not in guards)
+    unmatched = re.compile(u'[{0}]*'.format(unmatched) if unmatched else u'')
+    return table, compile_scanner(rules, flags), guards, unmatched.match
+
+
+_DIALECT_DISPATCH = {}
+
+
+def get_dispatch(dialect=None):
+    """Return the scanners of *dialect* built by :func:`compile_dispatch`.
+
+    They're compiled when first used and kept for the lifetime of the
+    process. ``None`` stands for all dialects at once.
+    """
+    try:
+        return _DIALECT_DISPATCH[dialect]
+    except KeyError:
+        dispatch = compile_dispatch(dialect_rules(dialect))
+        return _DIALECT_DISPATCH.setdefault(dialect, dispatch)
 
 
 class Lexer(object):
@@ -25,18 +203,10 @@ class Lexer(object):
     """
 
     @staticmethod
-    def get_tokens(text, encoding=None):
-        """
-        Return an iterable of (tokentype, value) pairs generated from
-        `text`. If `unfiltered` is set to `True`, the filtering mechanism
-        is bypassed even if filters are defined.
-
-        Also preprocess the text, i.e. expand tabs and strip it if
-        wanted and applies registered filters.
+    def decode(text, encoding=None):
+        """Return the unicode string to lex from *text*.
 
-        Split ``text`` into (tokentype, text) pairs.
-
-        ``stack`` is the initial stack (default: ``['root']``)
+        *text* may be a string, bytes or a file-like object.
         """
         if isinstance(text, file_types):
             text = text.read()
@@ -55,28 +225,468 @@ class Lexer(object):
             raise TypeError(u"Expected text or file-like object, got {!r}".
                             format(type(text)))
 
-        iterable = enumerate(text)
-        for pos, char in iterable:
-            for rexmatch, action in SQL_REGEX:
-                m = rexmatch(text, pos)
+        return text
+
+    @staticmethod
+    def get_spans(text, pos=0, dialect=None):
+        """
+        Return an iterable of (tokentype, start, end) tuples generated
+        from the unicode string `text`, starting at offset `pos`.
+
+        The token values are not copied out of `text`, ``text[start:end]``
+        is the value of a token.
+
+        Only the rules of `dialect` are used if given, see
+        :func:`~sqlparse.keywords.dialect_rules`.
+        """
+        return _scan(text, pos, dialect)
+
+    @staticmethod
+    def get_parallel_spans(text, processes=None, shard_size=None,
+                           dialect=None):
+        """
+        Return an iterable of (tokentype, start, end) tuples like
+        :meth:`get_spans` does, lexing parts of `text` in a pool of
+        `processes` worker processes (defaults to the number of CPUs).
+
+        The text is cut into shards of about `shard_size` characters, before
+        a statement keyword at the start of a line if possible. A shard is
+        lexed as if a token started at its beginning. If the tokens of the
+        previous shard end elsewhere, the text from there on is lexed again
+        until a token starts where one of the shard did. Hence the result
+        is the same as of :meth:`get_spans`.
+        """
+        # imported here, only needed for lexing in parallel
+        import multiprocessing
+
+        processes = processes or multiprocessing.cpu_count()
+        shard_size = shard_size or max(
+            len(text) // (4 * processes), SHARD_SIZE)
+        bounds = _shard_bounds(text, shard_size)
+        if processes < 2 or len(bounds) < 2:
+            for span in Lexer.get_spans(text, dialect=dialect):
+                yield span
+            return
 
-                if not m:
+        # compiled before forking, workers don't need to compile it again
+        get_dispatch(dialect)
+        pool = multiprocessing.Pool(processes, _init_shard, (text, dialect))
+        try:
+            pos = 0
+            for shard in pool.imap(_lex_shard, bounds):
+                start, stop, names, ttypes, starts, end = shard
+                if pos >= stop:
+                    # the tokens of the previous shard covered this one
                     continue
-                elif isinstance(action, tokens._TokenType):
-                    yield action, m.group()
-                elif callable(action):
-                    yield action(m.group())
 
-                consume(iterable, m.end() - pos - 1)
-                break
+                idx = 0
+                if pos != start:
+                    for span in Lexer.get_spans(text, pos, dialect):
+                        pos = span[1]
+                        idx = bisect_left(starts, pos, idx)
+                        if pos >= stop or (
+                                idx < len(starts) and starts[idx] == pos):
+                            break
+                        yield span
+                    else:
+                        pos = len(text)
+                    if pos >= stop:
+                        continue
+
+                names = [reduce(getattr, name, tokens.Token)
+                         for name in names]
+                ends = starts[idx + 1:]
+                ends.append(end)
+                for span in zip(map(names.__getitem__, ttypes[idx:]),
+                                starts[idx:], ends):
+                    yield span
+                pos = end
+        finally:
+            pool.terminate()
+
+    @staticmethod
+    def get_tokens(text, encoding=None, dialect=None):
+        """
+        Return an iterable of (tokentype, value) pairs generated from
+        `text`, the values of the spans of :meth:`get_spans`.
+
+        File-like objects are read in chunks, see :meth:`get_stream_tokens`.
+
+        Only the rules of `dialect` are used if given.
+        """
+        if isinstance(text, file_types):
+            for token in Lexer.get_stream_tokens(text, dialect=dialect,
+                                                 encoding=encoding):
+                yield token
+            return
+
+        text = Lexer.decode(text, encoding)
+        for token in _scan(text, dialect=dialect, values=True):
+            yield token
+
+    @staticmethod
+    def get_stream_tokens(stream, chunk_size=None, dialect=None,
+                          encoding=None):
+        """
+        Return an iterable of (tokentype, value) pairs read from the
+        file-like object `stream` in chunks of `chunk_size` characters.
+
+        Tokens at the end of a chunk and unterminated literals or comments
+        may continue in the next chunk. They're held back and lexed again
+        together with it, only the text from the first of them on is kept.
+
+        Bytes are decoded like :meth:`decode` does, characters may span
+        two chunks. Without `encoding`, the rest of the stream is decoded
+        with ``unicode-escape`` once it isn't valid UTF-8.
+        """
+        chunk_size = chunk_size or CHUNK_SIZE
+        size = chunk_size
+        text, pos = u'', 0
+        decoder = None
+        while True:
+            chunk = stream.read(size)
+            if isinstance(chunk, bytes):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(
+                        encoding or 'utf-8')()
+                try:
+                    text += decoder.decode(chunk, final=not chunk)
+                except UnicodeDecodeError:
+                    if encoding:
+                        raise
+                    # the bytes of a character started in the last chunk
+                    pending = decoder.getstate()[0]
+                    decoder = codecs.getincrementaldecoder(
+                        'unicode-escape')()
+                    text += decoder.decode(pending + chunk, final=not chunk)
             else:
-                yield tokens.Error, char
+                text += Lexer.decode(chunk, encoding)
+            if not chunk:
+                for ttype, start, end in Lexer.get_spans(text, pos, dialect):
+                    yield ttype, text[start:end]
+                return
 
+            spans = list(Lexer.get_spans(text, pos, dialect))
+            idx, _ = _restart_index(text, spans, len(text))
+            for ttype, start, end in spans[:idx]:
+                yield ttype, text[start:end]
+
+            if idx:
+                # keep a single character for the lookbehind of rules
+                text, pos = text[spans[idx][1] - 1:], 1
+                size = chunk_size
+            else:
+                # read more at once, a single token spans all the text
+                size *= 2
 
-def tokenize(sql, encoding=None):
+
+def tokenize(sql, encoding=None, dialect=None, processes=None):
     """Tokenize sql.
 
     Tokenize *sql* using the :class:`Lexer` and return a 2-tuple stream
-    of ``(token type, value)`` items.
+    of ``(token type, value)`` items. If *dialect* is given only its rules
+    are used. If *processes* is given, parts of *sql* are lexed in that
+    many processes, see :meth:`Lexer.get_parallel_spans`.
+    """
+    if processes:
+        text = Lexer.decode(sql, encoding)
+        return ((ttype, text[start:end]) for ttype, start, end
+                in Lexer.get_parallel_spans(text, processes, dialect=dialect))
+    return Lexer().get_tokens(sql, encoding, dialect)
+
+
+def _scan(text, pos=0, dialect=None, values=False):
+    """Yields the ``(tokentype, start, end)`` spans of *text* from *pos* on,
+    or ``(tokentype, value)`` pairs if *values* is ``True``."""
+    table, default, guards, unmatched = get_dispatch(dialect)
+    found = {}
+    error = None
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        scanner = table.get(char, default)
+        if char in guards and not _is_closed(text, pos, guards[char], found):
+            scanner = guards[char][2]
+        m = scanner and scanner[0](text, pos)
+
+        if not m:
+            # a run of characters no rule matches is a single token
+            if error is None:
+                error = pos
+            pos = unmatched(text, pos + 1).end()
+            continue
+        elif error is not None:
+            yield (tokens.Error, text[error:pos]) if values \
+                else (tokens.Error, error, pos)
+            error = None
+
+        action, end = scanner[1][m.lastindex], m.end()
+        if not isinstance(action, tokens._TokenType):
+            if not callable(action):
+                pos = end
+                continue
+            action = action(m.group())[0]
+        yield (action, text[pos:end]) if values else (action, pos, end)
+        pos = end
+
+    if error is not None:
+        yield (tokens.Error, text[error:]) if values \
+            else (tokens.Error, error, length)
+
+
+# Number of characters read at once from file-like objects.
+CHUNK_SIZE = 65536
+
+# Minimal number of characters lexed at once by a worker process.
+SHARD_SIZE = 1 << 20
+
+# Statements at the start of a line, a likely token boundary to split at
+_SHARD_BOUNDARY = re.compile(
+    r'(?<=\n)(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|WITH)\b', FLAGS)
+_LINE_START = re.compile(r'(?<=\n)')
+
+
+def _shard_bounds(text, shard_size):
+    """Returns a list of ``(start, stop)`` offsets cutting *text* into
+    shards of about *shard_size* characters."""
+    bounds = []
+    start, length = 0, len(text)
+    while start < length:
+        stop = start + shard_size
+        window = stop + shard_size // 4
+        m = _SHARD_BOUNDARY.search(text, stop, window) \
+            or _LINE_START.search(text, stop, window)
+        stop = min(m.start() if m else stop, length)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+# Text lexed by a worker process and its dialect
+_shard_text = _shard_dialect = None
+
+
+def _init_shard(text, dialect):
+    global _shard_text, _shard_dialect
+    _shard_text, _shard_dialect = text, dialect
+
+
+def _lex_shard(bounds):
+    """Lexes a shard in a worker process.
+
+    Lexing starts at the beginning of the shard and ends at the first token
+    starting at or after its end. Token types are returned by index into a
+    list of their names, unpickled types wouldn't be the same objects.
+
+    :returns: A 6-tuple of the *bounds*, the names of token types, arrays
+      with the token types and starts and the end of the last token.
+    """
+    start, stop = bounds
+    names = {}
+    ttypes, starts = array('H'), array('q')
+    end = len(_shard_text)
+    for ttype, pos, _ in Lexer.get_spans(_shard_text, start, _shard_dialect):
+        if pos >= stop:
+            end = pos
+            break
+        ttypes.append(names.setdefault(ttype, len(names)))
+        starts.append(pos)
+    names = [tuple(ttype) for ttype in sorted(names, key=names.get)]
+    return start, stop, names, ttypes, starts, end
+
+
+# Number of tokens (whitespace aside) before an edit that are lexed again.
+# Rules like "AT TIME ZONE '...'" match up to four words at once.
+RELEX_CONTEXT = 4
+
+# Number of dollar quote tags searched for one by one, before all tags of
+# a text are indexed at once.
+MAX_TAG_SEARCHES = 8
+
+_OPENING_CHARS = re.compile(u'[\'"`\xb4$\\[/]')
+_DOLLAR_TAG = re.compile(r'\$(?:[_A-ZÀ-Ü]\w*)?\$', FLAGS)
+# all dollar quote tags, including overlapping ones like in "$a$b$"
+_DOLLAR_TAGS = re.compile(r'\$(?=((?:[_A-ZÀ-Ü]\w*)?\$))', FLAGS)
+
+
+def _is_closed(text, pos, guard, found):
+    """Checks whether the closing delimiter of *guard* follows its opening
+    delimiter at *pos*, or if there's no opening delimiter at all.
+
+    *found* caches the next occurrence of closing delimiters for the
+    *text*. Each part of it is thus searched once per delimiter, instead
+    of once per unterminated literal. Dollar quote tags are searched one
+    by one until :data:`MAX_TAG_SEARCHES` of them lacked their end, then
+    all tags from *pos* on are indexed.
+    """
+    opener, closer = guard[:2]
+    if opener is None:
+        m = _DOLLAR_TAG.match(text, pos)
+        if m is None:
+            return True
+        tag = m.group().lower()
+        if None not in found:
+            idx = found.get(tag)
+            if idx is None or 0 <= idx < m.end():
+                # Tags are matched ignoring case
+                closing = re.compile(re.escape(tag), FLAGS).search(
+                    text, m.end())
+                idx = found[tag] = closing.start() if closing else -1
+                if idx < 0:
+                    # the number of tags lacking their end
+                    found[False] = found.get(False, 0) + 1
+            if idx >= 0 or found.get(False, 0) < MAX_TAG_SEARCHES:
+                return idx >= 0
+            # Each tag lacking its end was searched up to the end of the
+            # text, index all of them at once instead.
+            found[None] = tags = {}
+            for m_tag in _DOLLAR_TAGS.finditer(text, pos):
+                tags.setdefault(
+                    m_tag.group().lower() + m_tag.group(1).lower(),
+                    []).append(m_tag.start())
+        starts = found[None].get(tag, ())
+        return bisect_left(starts, m.end()) < len(starts)
+    elif not text.startswith(opener, pos):
+        return True
+
+    start = pos + len(opener)
+    idx = found.get(closer)
+    if idx is None or 0 <= idx < start:
+        idx = found[closer] = text.find(closer, start)
+    return idx >= 0
+
+
+def _is_unterminated(text, ttype, start, end):
+    """Checks if the token at *start* may be the beginning of a literal,
+    comment or quoted name that lacked its end, i.e. that would be lexed
+    differently if text after it changes."""
+    char = text[start]
+    if ttype is tokens.Error:
+        # characters no rule matched, e.g. a quote lacking its end
+        return _OPENING_CHARS.search(text, start, end) is not None
+    elif char == '`' and ttype in tokens.Operator:
+        return True
+    elif char == '/' and ttype in tokens.Operator:
+        return text.startswith('*', start + 1)
+    elif char == '[':
+        return start == 0 or re.match(r'[^\w\])]', text[start - 1], FLAGS)
+    elif char == '$' and ttype is not tokens.Literal:
+        return _DOLLAR_TAG.match(text, start) is not None
+    elif char in u'\'"`\xb4':
+        # The quote ending the literal was given up in favor of a longer
+        # match ending at a quote that's missing, e.g. 'a'' or 'a\'.
+        return text.startswith(char, end) or text[end - 2] == '\\'
+    return False
+
+
+def _first_unterminated(text, spans, starts):
+    """Returns an offset of *text* before which no literal, comment or
+    quoted name lacks its end.
+
+    An opening delimiter is unterminated only if its closing delimiter
+    doesn't follow anywhere, so the candidates are found by searching for
+    the last closing delimiters instead of looking at every token.
     """
-    return Lexer().get_tokens(sql, encoding)
+    first = len(text)
+    for quote in u'\'"`\xb4':
+        last = text.rfind(quote)
+        if last >= 0:
+            # Either the last quote lacks its end or a literal ending right
+            # before or at it gave up a longer match, see _is_unterminated.
+            uidx = max(0, bisect_right(starts, max(0, last - 1)) - 1)
+            first = min(first, starts[uidx])
+    for opener, closer in (('/*', '*/'), ('[', ']')):
+        start = text.find(
+            opener, max(0, text.rfind(closer) - len(opener) + 1))
+        if start >= 0:
+            first = min(first, start)
+    if u'$' in text:
+        # Only the last occurrence of a dollar quote tag may lack its end.
+        # It's the first one found in the reversed text, unless there are
+        # too many tags to search for one by one.
+        last = {}
+        tags = set(map(text_type.lower, _DOLLAR_TAGS.findall(text)))
+        if len(tags) <= MAX_TAG_SEARCHES:
+            reversed_text = text[::-1]
+            for tag in tags:
+                m = re.search(re.escape((u'$' + tag)[::-1]), reversed_text,
+                              FLAGS)
+                last[tag] = len(text) - m.end()
+        else:
+            for m in _DOLLAR_TAGS.finditer(text):
+                last[m.group(1).lower()] = m.start()
+        for start in last.values():
+            uidx = max(0, bisect_right(starts, start) - 1)
+            if start < first and (starts[uidx] == start
+                                  or spans[uidx][0] is tokens.Error):
+                first = start
+    return first
+
+
+def _restart_index(text, spans, offset):
+    """Returns the index of the first span that may change if *text* is
+    edited at *offset*, and the list of start offsets of the spans."""
+    # Spans are contiguous, the end of a span is the start of the next one
+    starts = list(map(itemgetter(1), spans))
+    if not spans:
+        return 0, starts
+
+    # Start at the first token touching the edit, it may be extended by an
+    # insertion, or at an unterminated literal or comment before it.
+    idx = max(0, bisect_left(starts, offset) - 1)
+    first = max(starts[0], _first_unterminated(text, spans, starts))
+    for m in _OPENING_CHARS.finditer(text, first, starts[idx]):
+        uidx = bisect_right(starts, m.start()) - 1
+        if (starts[uidx] == m.start() or spans[uidx][0] is tokens.Error) \
+                and _is_unterminated(text, *spans[uidx]):
+            idx = uidx
+            break
+    # Preceding words may be part of the same token, e.g. "LEFT OUTER JOIN"
+    context = RELEX_CONTEXT
+    while idx > 0 and context > 0:
+        idx -= 1
+        if spans[idx][0] not in tokens.Whitespace:
+            context -= 1
+    return idx, starts
+
+
+def relex(text, spans, offset, removed, inserted, dialect=None):
+    """Update the spans of *text* after an edit.
+
+    *spans* is the list of ``(tokentype, start, end)`` tuples returned by
+    :meth:`Lexer.get_spans` for *text*. The edit replaces *removed*
+    characters at *offset* by the string *inserted*. *dialect* must be the
+    one *spans* were created for.
+
+    Lexing restarts at a token boundary a few tokens before the edit (or
+    at an unterminated literal or comment before it) and stops as soon as
+    a new token starts behind the edit where an old one did. The remaining
+    old spans are reused.
+
+    :returns: A 2-tuple of the edited text and its list of spans.
+    """
+    new_text = text[:offset] + inserted + text[offset + removed:]
+    delta = len(inserted) - removed
+    edit_end = offset + len(inserted)
+
+    idx, starts = _restart_index(text, spans, offset)
+    result = spans[:idx]
+    pos = spans[idx][1] if idx < len(spans) else 0
+    old_idx = idx
+    for ttype, start, end in Lexer.get_spans(new_text, pos, dialect):
+        # Behind the edit lexing continues like before once the boundaries
+        # match, the lookbehind of rules covers a single character only.
+        if start > edit_end:
+            while old_idx < len(spans) and spans[old_idx][1] + delta < start:
+                old_idx += 1
+            if old_idx < len(spans) and spans[old_idx][1] + delta == start:
+                if delta:
+                    ttypes = map(itemgetter(0), spans[old_idx:])
+                    starts = list(map(add, starts[old_idx:], repeat(delta)))
+                    ends = starts[1:] + [len(new_text)]
+                    result.extend(zip(ttypes, starts, ends))
+                else:
+                    result.extend(spans[old_idx:])
+                break
+        result.append((ttype, start, end))
+    return new_text, result
@@ -10,10 +10,14 @@
 from __future__ import print_function
 
 import re
+import weakref
+from array import array
+from bisect import bisect_right
 
 from sqlparse import tokens as T
-from sqlparse.compat import string_types, text_type, unicode_compatible
-from sqlparse.utils import imt, remove_quotes
+from sqlparse.compat import (
+    StringIO, string_types, text_type, unicode_compatible, xrange)
+from sqlparse.utils import compile_regexes, get_matcher, imt, remove_quotes
 
 
 class NameAliasMixin:
@@ -46,21 +50,70 @@ class Token(object):
     It represents a single token and has two instance attributes:
     ``value`` is the unchanged value of the token and ``ttype`` is
     the type of the token.
+
+    Tokens created by :meth:`from_span` additionally know their position
+    ``start`` and ``end`` in the ``source`` string. For other tokens these
+    attributes are ``None``.
+
+    ``parent`` is the group containing the token. Trees can reference it
+    weakly, see :meth:`TokenList.weaken_parents`.
     """
 
-    __slots__ = ('value', 'ttype', 'parent', 'normalized', 'is_keyword',
-                 'is_group', 'is_whitespace')
+    __slots__ = ('value', 'ttype', '_parent', 'normalized', 'is_keyword',
+                 'is_group', 'is_whitespace', 'source', 'start', 'end')
 
     def __init__(self, ttype, value):
         value = text_type(value)
         self.value = value
         self.ttype = ttype
-        self.parent = None
+        self._parent = None
         self.is_group = False
         self.is_keyword = ttype in T.Keyword
         self.is_whitespace = self.ttype in T.Whitespace
         self.normalized = value.upper() if self.is_keyword else value
 
+    @classmethod
+    def from_span(cls, ttype, source, start, end):
+        """Create a token for ``source[start:end]``.
+
+        The ``value`` isn't copied out of *source* until it's accessed.
+        """
+        token = cls.__new__(cls)
+        token.ttype = ttype
+        token._parent = None
+        token.is_group = False
+        token.is_keyword = ttype in T.Keyword
+        token.is_whitespace = ttype in T.Whitespace
+        token.source = source
+        token.start = start
+        token.end = end
+        return token
+
+    def __getattr__(self, name):
+        # Only called for unset slots, i.e. the lazy attributes of tokens
+        # created by from_span() or the span of any other token.
+        if name == 'value':
+            self.value = self.source[self.start:self.end]
+            return self.value
+        elif name == 'normalized':
+            value = self.value
+            self.normalized = value.upper() if self.is_keyword else value
+            return self.normalized
+        elif name in ('source', 'start', 'end'):
+            return None
+        raise AttributeError(name)
+
+    @property
+    def parent(self):
+        parent = self._parent
+        if type(parent) is weakref.ref:
+            return parent()
+        return parent
+
+    @parent.setter
+    def parent(self, parent):
+        self._parent = parent
+
     def __str__(self):
         return self.value
 
@@ -111,9 +164,7 @@ class Token(object):
         if regex:
             # TODO: Add test for regex with is_keyboard = false
             flag = re.IGNORECASE if self.is_keyword else 0
-            values = (re.compile(v, flag) for v in values)
-
-            for pattern in values:
+            for pattern in compile_regexes(values, flag):
                 if pattern.search(self.normalized):
                     return True
             return False
@@ -150,6 +201,116 @@ class Token(object):
         return False
 
 
+class TokenTable(object):
+    """A flat stream of tokens stored column-wise.
+
+    A token is stored as the index of its type in ``types`` and as its
+    start in the ``source`` string, both in arrays. Tokens are contiguous,
+    a token ends where the next one starts. Accessing a token by index
+    creates a :class:`Token` referencing ``source`` by offset.
+    """
+
+    def __init__(self, source=u'', types=None, type_ids=None, starts=None):
+        self.source = source
+        self.types = types or []
+        self.type_ids = type_ids or array('H')
+        self.starts = starts or array(
+            'I' if len(source) <= 0xffffffff else 'Q')
+        self._type_index = dict((ttype, idx)
+                                for idx, ttype in enumerate(self.types))
+
+    @classmethod
+    def from_spans(cls, spans, source):
+        """Create a table of ``(ttype, start, end)`` *spans* into *source*,
+        as returned by :meth:`~sqlparse.lexer.Lexer.get_spans`."""
+        table = cls(source)
+        type_index = table._type_index
+        add_type_id, add_start = table.type_ids.append, table.starts.append
+        for ttype, start, _ in spans:
+            type_id = type_index.get(ttype)
+            if type_id is None:
+                type_id = table._add_type(ttype)
+            add_type_id(type_id)
+            add_start(start)
+        return table
+
+    @classmethod
+    def from_tokens(cls, stream):
+        """Create a table of ``(ttype, value)`` pairs.
+
+        The ``source`` of the table is made of the values.
+        """
+        types, type_index = [], {}
+        type_ids, starts = array('H'), array('Q')
+        values = StringIO()
+        pos = 0
+        for ttype, value in stream:
+            type_id = type_index.get(ttype)
+            if type_id is None:
+                type_id = type_index[ttype] = len(types)
+                types.append(ttype)
+            type_ids.append(type_id)
+            starts.append(pos)
+            values.write(value)
+            pos += len(value)
+        if pos <= 0xffffffff:
+            starts = array('I', starts)
+        return cls(values.getvalue(), types, type_ids, starts)
+
+    def _add_type(self, ttype):
+        self._type_index[ttype] = type_id = len(self.types)
+        self.types.append(ttype)
+        return type_id
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        ttype = self.types[self.type_ids[idx]]
+        start, end = self.span(idx)
+        return Token.from_span(ttype, self.source, start, end)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def span(self, idx):
+        """Returns the start and end of the token at *idx* in ``source``."""
+        if idx < 0:
+            idx += len(self)
+        start = self.starts[idx]
+        end = self.starts[idx + 1] if idx + 1 < len(self) \
+            else len(self.source)
+        return start, end
+
+    def value(self, first, stop):
+        """Returns the source of the tokens from index *first* to
+        ``stop - 1``."""
+        return self.source[self.span(first)[0]:self.span(stop - 1)[1]]
+
+    def spans(self):
+        """Return an iterable of ``(ttype, start, end)`` tuples."""
+        ends = self.starts[1:]
+        ends.append(len(self.source))
+        return zip(map(self.types.__getitem__, self.type_ids),
+                   self.starts, ends)
+
+    def items(self):
+        """Return an iterable of ``(ttype, value)`` pairs."""
+        source = self.source
+        for ttype, start, end in self.spans():
+            yield ttype, source[start:end]
+
+
+def _has_value(token, _value=Token.value):
+    """Returns ``True`` if the lazy value of *token* is set."""
+    try:
+        _value.__get__(token)
+    except AttributeError:
+        return False
+    return True
+
+
 @unicode_compatible
 class TokenList(Token):
     """A group of tokens.
@@ -158,13 +319,97 @@ class TokenList(Token):
     list of child-tokens.
     """
 
-    __slots__ = 'tokens'
+    __slots__ = ('tokens', '_positions', '_shift', '_offsets', '__weakref__')
 
     def __init__(self, tokens=None):
+        # The value is joined from the tokens when it's first accessed
         self.tokens = tokens or []
-        [setattr(token, 'parent', self) for token in self.tokens]
-        super(TokenList, self).__init__(None, text_type(self))
+        self._positions = None
+        self._shift = 0
+        self._offsets = None
+        [setattr(token, '_parent', self) for token in self.tokens]
+        self.ttype = None
+        self._parent = None
         self.is_group = True
+        self.is_keyword = False
+        self.is_whitespace = False
+
+    @classmethod
+    def from_span(cls, tokens, source, start, end):
+        """Create a group of *tokens* for ``source[start:end]``.
+
+        The ``value`` isn't copied out of *source* until it's accessed.
+        """
+        tlist = super(TokenList, cls).from_span(None, source, start, end)
+        tlist.tokens = tokens
+        tlist._positions = None
+        tlist._shift = 0
+        tlist._offsets = None
+        [setattr(token, '_parent', tlist) for token in tokens]
+        tlist.is_group = True
+        return tlist
+
+    def __getattr__(self, name):
+        if name == 'value':
+            self._fill_values()
+            return self.value
+        return super(TokenList, self).__getattr__(name)
+
+    def _fill_values(self):
+        """Sets the values of the group and the groups below it that have
+        none yet.
+
+        The values are built from the cached values of the child groups,
+        the groups below without one are done first, without recursion.
+        A group with a value always has groups with values below it, so
+        :meth:`_reset_value` can stop at the first group without one.
+        """
+        stack = [self]
+        while stack:
+            tlist = stack[-1]
+            missing = [token for token in tlist.tokens
+                       if token.is_group and not _has_value(token)]
+            if missing:
+                stack.extend(missing)
+                continue
+            if not _has_value(tlist):
+                tlist.value = u''.join(token.value for token in tlist.tokens)
+            stack.pop()
+
+    def weaken_parents(self):
+        """Makes the tokens of this tree reference their parents weakly.
+
+        The tree has no reference cycles afterwards, so it's freed as soon
+        as the last reference to this group is gone, without waiting for
+        the cyclic garbage collector. Tokens of a freed tree have no
+        ``parent`` anymore. Parents set later, e.g. by :meth:`insert_before`,
+        are strong references again.
+        """
+        stack = [self]
+        while stack:
+            tlist = stack.pop()
+            ref = weakref.ref(tlist)
+            for token in tlist.tokens:
+                token._parent = ref
+                if token.is_group:
+                    stack.append(token)
+
+    def _reset_value(self, parents=True):
+        """Drops the cached value and offset index of the group and, if
+        *parents* is ``True``, of the groups containing it.
+
+        The groups containing one without a value have none either, so the
+        walk up stops there.
+        """
+        tlist = self
+        while tlist is not None and _has_value(tlist):
+            for name in ('value', 'normalized'):
+                try:
+                    delattr(tlist, name)
+                except AttributeError:
+                    pass
+            tlist._offsets = None
+            tlist = tlist.parent if parents else None
 
     def __str__(self):
         return u''.join(token.value for token in self.flatten())
@@ -200,26 +445,62 @@ class TokenList(Token):
                 parent_pre = u'   ' if last else u'|  '
                 token._pprint_tree(max_depth, depth + 1, f, _pre + parent_pre)
 
+    def _get_offsets(self):
+        """Returns the ungrouped tokens and a sorted array of their
+        offsets, built on first use."""
+        if self._offsets is None:
+            # the index is dropped along with the value
+            self._fill_values()
+            leaves = list(self.flatten())
+            starts = array('I' if len(self.value) <= 0xffffffff else 'Q')
+            pos = 0
+            for token in leaves:
+                starts.append(pos)
+                pos += len(token.value)
+            self._offsets = leaves, starts
+        return self._offsets
+
     def get_token_at_offset(self, offset):
         """Returns the token that is on position offset."""
-        idx = 0
-        for token in self.flatten():
-            end = idx + len(token.value)
-            if idx <= offset < end:
-                return token
-            idx = end
+        leaves, starts = self._get_offsets()
+        # the last token starting at offset, tokens without a value
+        # before it don't cover offset
+        idx = bisect_right(starts, offset) - 1
+        if idx >= 0 and offset < starts[idx] + len(leaves[idx].value):
+            return leaves[idx]
+
+    def get_groups_at_offset(self, offset):
+        """Returns the groups containing the token on position *offset*,
+        from the innermost one up to this group.
+
+        An empty list is returned if there's no token on that position.
+        """
+        token = self.get_token_at_offset(offset)
+        groups = []
+        parent = token.parent if token is not None else None
+        while parent is not None:
+            groups.append(parent)
+            if parent is self:
+                break
+            parent = parent.parent
+        return groups
 
     def flatten(self):
         """Generator yielding ungrouped tokens.
 
-        This method is recursively called for all child tokens.
+        Child groups are descended into with a stack of iterators instead
+        of recursion, so each token is yielded by a single generator
+        regardless of how deep it's nested.
         """
-        for token in self.tokens:
-            if token.is_group:
-                for item in token.flatten():
-                    yield item
-            else:
+        stack = [iter(self.tokens)]
+        while stack:
+            for token in stack[-1]:
+                if token.is_group:
+                    stack.append(iter(token.tokens))
+                    break
                 yield token
+            else:
+                stack.pop()
 
     def get_sublists(self):
         for token in self.tokens:
@@ -230,6 +511,18 @@ class TokenList(Token):
     def _groupable_tokens(self):
         return self.tokens
 
+    def token_scan(self, start=0, end=None, reverse=False):
+        """Yields ``(idx, token)`` for the child tokens from *start* up to
+        *end*, or down to *end* if *reverse* is ``True``.
+
+        *start* and *end* are interpreted like in ``tokens[start:end]``,
+        but the list isn't copied. It must not be changed while scanning.
+        """
+        tokens = self.tokens
+        step = -1 if reverse else 1
+        for idx in xrange(*slice(start, end, step).indices(len(tokens))):
+            yield idx, tokens[idx]
+
     def _token_matching(self, funcs, start=0, end=None, reverse=False):
         """next token that match functions"""
         if start is None:
@@ -240,16 +533,20 @@ class TokenList(Token):
 
         if reverse:
             assert end is None
-            for idx in range(start - 2, -1, -1):
-                token = self.tokens[idx]
-                for func in funcs:
-                    if func(token):
-                        return idx, token
+            start -= 2
+            if start < 0:
+                return None, None
+            offset = 0
+        elif start < 0:
+            # Numbered from a negative start like enumerate(tokens[start:])
+            # does, grouping relies on it once tokens were grouped already.
+            offset = start - max(0, len(self.tokens) + start)
         else:
-            for idx, token in enumerate(self.tokens[start:end], start=start):
-                for func in funcs:
-                    if func(token):
-                        return idx, token
+            offset = 0
+        for idx, token in self.token_scan(start, end, reverse):
+            for func in funcs:
+                if func(token):
+                    return idx + offset, token
         return None, None
 
     def token_first(self, skip_ws=True, skip_cm=False):
@@ -269,7 +566,7 @@ class TokenList(Token):
 
     def token_next_by(self, i=None, m=None, t=None, idx=-1, end=None):
         idx += 1
-        return self._token_matching(lambda tk: imt(tk, i, m, t), idx, end)
+        return self._token_matching(get_matcher(i, m, t), idx, end)
 
     def token_not_matching(self, funcs, idx):
         funcs = (funcs,) if not isinstance(funcs, (list, tuple)) else funcs
@@ -308,7 +605,27 @@ class TokenList(Token):
     def token_index(self, token, start=0):
         """Return list index of token."""
         start = start if isinstance(start, int) else self.token_index(start)
-        return start + self.tokens[start:].index(token)
+        idx = self._position(token)
+        if idx is None or idx < start:
+            return self.tokens.index(token, start)
+        return idx
+
+    def _position(self, token):
+        # The positions of the children are indexed on first use. Tokens
+        # added by insert_before/insert_after move the children behind
+        # them by one, that's counted in _shift. Any other change of the
+        # tokens is noticed when the position found doesn't hold the token
+        # and the index is rebuilt.
+        tokens = self.tokens
+        if self._positions is not None:
+            idx = self._positions.get(id(token))
+            if idx is not None:
+                for pos in (idx + self._shift, idx):
+                    if pos < len(tokens) and tokens[pos] is token:
+                        return pos
+        self._positions = dict((id(tk), i) for i, tk in enumerate(tokens))
+        self._shift = 0
+        return self._positions.get(id(token))
 
     def group_tokens(self, grp_cls, start, end, include_end=True,
                      extend=False):
@@ -328,15 +645,23 @@ class TokenList(Token):
             grp = start
             grp.tokens.extend(subtokens)
             del self.tokens[start_idx + 1:end_idx]
-            grp.value = text_type(start)
+            # the text of the groups containing it didn't change
+            if _has_value(self):
+                value = grp.value + u''.join(t.value for t in subtokens)
+                grp._reset_value(parents=False)
+                grp.value = value
+            else:
+                grp._reset_value(parents=False)
         else:
             subtokens = self.tokens[start_idx:end_idx]
             grp = grp_cls(subtokens)
             self.tokens[start_idx:end_idx] = [grp]
-            grp.parent = self
+            grp._parent = self
+            if _has_value(self):
+                grp._fill_values()
 
         for token in subtokens:
-            token.parent = grp
+            token._parent = grp
 
         return grp
 
@@ -344,19 +669,23 @@ class TokenList(Token):
         """Inserts *token* before *where*."""
         if not isinstance(where, int):
             where = self.token_index(where)
-        token.parent = self
+        token._parent = self
         self.tokens.insert(where, token)
+        self._shift += 1
+        self._reset_value()
 
     def insert_after(self, where, token, skip_ws=True):
         """Inserts *token* after *where*."""
         if not isinstance(where, int):
             where = self.token_index(where)
         nidx, next_ = self.token_next(where, skip_ws=skip_ws)
-        token.parent = self
+        token._parent = self
         if next_ is None:
             self.tokens.append(token)
         else:
             self.tokens.insert(nidx, token)
+        self._shift += 1
+        self._reset_value()
 
     def has_alias(self):
         """Returns ``True`` if an alias is present."""
@@ -392,14 +721,16 @@ class TokenList(Token):
                         real_name=False):
         """Returns the name of the first token with a name"""
 
-        tokens = self.tokens[idx:] if idx else self.tokens
-        tokens = reversed(tokens) if reverse else tokens
+        if reverse:
+            tokens = self.token_scan(-1, idx - 1 if idx else None, True)
+        else:
+            tokens = self.token_scan(idx)
         types = [T.Name, T.Wildcard, T.String.Symbol]
 
         if keywords:
             types.append(T.Keyword)
 
-        for token in tokens:
+        for _, token in tokens:
             if token.ttype in types:
                 return remove_quotes(token.value)
             elif isinstance(token, (Identifier, Function)):
@@ -409,6 +740,12 @@ class TokenList(Token):
 class Statement(TokenList):
     """Represents a SQL statement."""
 
+    #: Set by the statement splitter to ``(type_bits, values)``: the
+    #: ``ancestors`` of all token types OR'ed together and the set of
+    #: normalized keyword and punctuation values of the tokens. Grouping
+    #: skips passes that can't find anything in a statement with it.
+    summary = None
+
     def get_type(self):
         """Returns the type of a statement.
 
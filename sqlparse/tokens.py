@@ -13,11 +13,35 @@
 """Tokens"""
 
 
+# Ids of token types by their path, e.g. ('Keyword', 'DML')
+_TYPE_IDS = {}
+
+
 class _TokenType(tuple):
+    """A token type, a subtype is created by accessing it as attribute.
+
+    Each path of names gets an integer ``id``, types created for the same
+    path share it. ``ancestors`` has the bits ``1 << id`` of the type and
+    of all its parents set, so checking if a type is a subtype is a single
+    integer operation.
+    """
     parent = None
 
+    def __init__(self, *args):
+        path = tuple(self)
+        ids = [_TYPE_IDS.setdefault(path[:i], len(_TYPE_IDS))
+               for i in range(len(path) + 1)]
+        self.id = ids[-1]
+        self.bit = 1 << self.id
+        self.ancestors = sum(1 << id_ for id_ in set(ids))
+
     def __contains__(self, item):
-        return item is not None and (self is item or item[:len(self)] == self)
+        if item is None:
+            return False
+        try:
+            return item.ancestors & self.bit != 0
+        except AttributeError:  # a plain tuple
+            return item[:len(self)] == self
 
     def __getattr__(self, name):
         new = _TokenType(self + (name,))
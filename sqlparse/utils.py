@@ -10,7 +10,8 @@ import itertools
 import re
 from collections import deque
 from contextlib import contextmanager
-from sqlparse.compat import text_type
+from functools import wraps
+from sqlparse.compat import string_types, text_type
 
 # This regular expression replaces the home-cooked parser that was here before.
 # It is much faster, but requires an extra post-processing step to get the
@@ -69,17 +70,50 @@ def recurse(*cls):
     :return: function
     """
     def wrap(f):
+        @wraps(f)
         def wrapped_f(tlist):
-            for sgroup in tlist.get_sublists():
-                if not isinstance(sgroup, cls):
-                    wrapped_f(sgroup)
-            f(tlist)
+            for sgroup in bottom_up(tlist, cls):
+                f(sgroup)
 
         return wrapped_f
 
     return wrap
 
 
+def bottom_up(tlist, cls=()):
+    """Yields the groups in *tlist* and then *tlist* itself. Each group
+    comes after the groups in it, groups that are instances of *cls* are
+    left out together with their content.
+
+    The tree is walked with an explicit stack, so deeply nested groups
+    don't hit the recursion limit. A group may be changed when it's
+    yielded, the groups in it are done already.
+    """
+    stack = [(tlist, tlist.get_sublists())]
+    while stack:
+        for sgroup in stack[-1][1]:
+            if not isinstance(sgroup, cls):
+                stack.append((sgroup, sgroup.get_sublists()))
+                break
+        else:
+            yield stack.pop()[0]
+
+
+def process_depth_first(process, tlist):
+    """Calls ``process(tlist)``, which returns ``None`` or an iterable of
+    groups to process the same way. Each group is processed completely
+    before the iterable is resumed, so *process* can hold state like
+    :func:`indent` across it, as with a recursive call.
+    """
+    stack = [iter(process(tlist) or ())]
+    while stack:
+        for sgroup in stack[-1]:
+            stack.append(iter(process(sgroup) or ()))
+            break
+        else:
+            stack.pop()
+
+
 def imt(token, i=None, m=None, t=None):
     """Helper function to simplify comparisons Instance, Match and TokenType
     :param token:
@@ -104,6 +138,127 @@ def imt(token, i=None, m=None, t=None):
         return False
 
 
+REGEX_CACHE_SIZE = 1000
+_regexes = {}
+
+
+def compile_regexes(values, flags=0):
+    """Returns a tuple of the compiled regular expressions *values*.
+
+    The tuples are cached by *values* and *flags*, so matching a token
+    against the same patterns again doesn't go through ``re.compile``.
+    """
+    key = values, flags
+    try:
+        return _regexes[key]
+    except KeyError:
+        pass
+    except TypeError:  # a list of patterns
+        key = tuple(values), flags
+        if key in _regexes:
+            return _regexes[key]
+    if len(_regexes) >= REGEX_CACHE_SIZE:
+        _regexes.clear()
+    _regexes[key] = result = tuple(re.compile(v, flags) for v in values)
+    return result
+
+
+class Matcher(object):
+    """Compiled arguments of :func:`imt`.
+
+    ``Matcher(i, m, t)(token)`` is the same as ``imt(token, i, m, t)``, but
+    the arguments are prepared once, so a matcher can be reused for every
+    token of a scan:
+
+    * A token type in *t* matches its subtypes, the types in a tuple
+      only match themselves. Both are kept as bitsets of type ids.
+    * The values of *m* are kept per token type in frozensets, upper-cased
+      for keywords, and regular expressions are compiled.
+    """
+
+    __slots__ = ('clss', 'bits', 'exact_bits', 'value_bits', 'values')
+
+    def __init__(self, i=None, m=None, t=None):
+        self.clss = i
+        types = [t, ] if t and not isinstance(t, list) else t or []
+        mpatterns = [m, ] if m and not isinstance(m, list) else m or []
+
+        self.bits = self.exact_bits = self.value_bits = 0
+        for ttype in types:
+            if hasattr(ttype, 'bit'):
+                self.bits |= ttype.bit
+            else:
+                for item in ttype:
+                    self.exact_bits |= item.bit
+
+        # Maps type ids to a tuple of values, keyword values, patterns and
+        # keyword patterns. Types matching any value are in exact_bits.
+        self.values = {}
+        for pattern in mpatterns:
+            self._add_pattern(*pattern)
+
+    def _add_pattern(self, ttype, values, regex=False):
+        if values is None:
+            self.exact_bits |= ttype.bit
+            return
+        if isinstance(values, string_types):
+            values = (values,)
+        spec = self.values.get(ttype.id, (frozenset(), frozenset(), (), ()))
+        if regex:
+            spec = spec[:2] + (
+                spec[2] + compile_regexes(values),
+                spec[3] + compile_regexes(values, re.IGNORECASE))
+        else:
+            spec = (spec[0] | frozenset(values),
+                    spec[1] | frozenset(v.upper() for v in values)) + spec[2:]
+        self.values[ttype.id] = spec
+        self.value_bits |= ttype.bit
+
+    def __call__(self, token):
+        if token is None:
+            return False
+        elif self.clss and isinstance(token, self.clss):
+            return True
+
+        ttype = token.ttype
+        if ttype is None:
+            return False
+        elif ttype.ancestors & self.bits or ttype.bit & self.exact_bits:
+            return True
+        elif ttype.bit & self.value_bits:
+            value = token.normalized
+            spec = self.values[ttype.id]
+            if token.is_keyword:
+                values, patterns = spec[1], spec[3]
+            else:
+                values, patterns = spec[0], spec[2]
+            return value in values or any(p.search(value) for p in patterns)
+        return False
+
+
+MATCHER_CACHE_SIZE = 1000
+_matchers = {}
+
+
+def get_matcher(i=None, m=None, t=None):
+    """Returns a :class:`Matcher` for the arguments of :func:`imt`.
+
+    Matchers for hashable arguments are cached, so scanning helpers that
+    get the same arguments on every call share one.
+    """
+    key = i, m, t
+    try:
+        return _matchers[key]
+    except KeyError:
+        pass
+    except TypeError:  # a list of patterns or types
+        return Matcher(i, m, t)
+    if len(_matchers) >= MATCHER_CACHE_SIZE:
+        _matchers.clear()
+    _matchers[key] = result = Matcher(i, m, t)
+    return result
+
+
 def consume(iterator, n):
     """Advance the iterator n-steps ahead. If n is none, consume entirely."""
     deque(itertools.islice(iterator, n), maxlen=0)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers for tests"""
+
+import time
+
+import pytest
+
+
+@pytest.fixture()
+def timed():
+    """Returns a function calling *func* with *args*, returning its result
+    and the time it took in seconds."""
+    def make_timed(func, *args):
+        start = time.time()
+        result = func(*args)
+        return result, time.time() - start
+
+    return make_timed
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import sqlparse
+
+
+@pytest.mark.parametrize('output_format, expected', [
+    ('python', "sql = 'select * from foo;'"),
+    ('php', '$sql = "select * from foo;";'),
+])
+def test_output_format(output_format, expected):
+    formatted = sqlparse.format('select * from foo;',
+                                output_format=output_format)
+    assert formatted == expected
+
+
+@pytest.mark.parametrize('output_format, expected', [
+    ('python', "sql = ('select a '\n"
+               "       'from b')"),
+    ('php', '$sql  = "select a ";\n'
+            '$sql .= "from b";'),
+])
+def test_output_format_newlines(output_format, expected):
+    # whitespace before line breaks is dropped like in plain output
+    formatted = sqlparse.format('select a  \nfrom b',
+                                output_format=output_format)
+    assert formatted == expected
+
+
+@pytest.mark.parametrize('output_format, expected', [
+    ('python', "sql = ('select a, '\n"
+               "       '       b '\n"
+               "       'from t '\n"
+               "       'where x = 1 '\n"
+               "       '  and y = 2')"),
+    ('php', '$sql  = "select a, ";\n'
+            '$sql .= "       b ";\n'
+            '$sql .= "from t ";\n'
+            '$sql .= "where x = 1 ";\n'
+            '$sql .= "  and y = 2";'),
+])
+def test_output_format_reindent(output_format, expected):
+    # line breaks inside of groups are quoted like the others
+    formatted = sqlparse.format('select a, b from t where x = 1 and y = 2',
+                                reindent=True, output_format=output_format)
+    assert formatted == expected
+    assert formatted.count('\n') == sqlparse.format(
+        'select a, b from t where x = 1 and y = 2',
+        reindent=True).count('\n')
+
+
+
+@pytest.mark.parametrize('sql', [
+    'select a, b from t where x = 1 and y = 2',
+    "insert into t values (1, 'a''b'), (2, 'c')",
+    'select a  \nfrom b',
+])
+def test_output_format_python_joined(sql):
+    # the quoted lines joined are the plain output with spaces for breaks
+    formatted = sqlparse.format(sql, reindent=True, output_format='python')
+    namespace = {}
+    exec(formatted, namespace)
+    plain = sqlparse.format(sql, reindent=True)
+    assert namespace['sql'] == plain.replace('\n', ' ')
+
+
+@pytest.mark.parametrize('wrap_after, expected', [
+    (10, 'select a, b ,\n       c, d\nfrom t'),
+    (20, 'select a, b , c, d\nfrom t'),
+])
+def test_wrap_after_strip_comments(wrap_after, expected):
+    # stripped comments don't count towards the width of the line
+    formatted = sqlparse.format('select a, b -- comment here\n, c, d from t',
+                                reindent=True, strip_comments=True,
+                                wrap_after=wrap_after)
+    assert formatted == expected
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ('select a, /* c */ b, c from t -- end',
+     'select a, b,\n          c\nfrom t'),
+    ('select a -- x\n, b from t where x = 1 /* y */ and y = 2',
+     'select a , b\nfrom t\nwhere x = 1\n  and y = 2'),
+    ('/* head */ select f(a) as b, c from t',
+     'select f(a) as b, c\nfrom t'),
+])
+def test_strip_comments_grouped(sql, expected):
+    # comments are grouped before they're stripped and lists are wrapped
+    formatted = sqlparse.format(sql, reindent=True, strip_comments=True,
+                                wrap_after=10)
+    assert formatted == expected
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+import sqlparse
+from sqlparse import sql
+from sqlparse.engine import FilterStack, grouping
+from sqlparse.exceptions import SQLParseError
+
+# The classes in the order the separate passes grouped them
+MATCHING_CLASSES = [sql.SquareBrackets, sql.Parenthesis, sql.Case, sql.If,
+                    sql.For, sql.Begin]
+
+
+def _group_matching_pass(tlist, cls):
+    """Groups the tokens of one class like the separate passes did before
+    group_matching, looking into other groups recursively."""
+    opens = []
+    tidx_offset = 0
+    for idx, token in enumerate(list(tlist)):
+        tidx = idx - tidx_offset
+
+        if token.is_whitespace:
+            continue
+
+        if token.is_group and not isinstance(token, cls):
+            _group_matching_pass(token, cls)
+            continue
+
+        if token.match(*cls.M_OPEN):
+            opens.append(tidx)
+
+        elif token.match(*cls.M_CLOSE):
+            try:
+                open_idx = opens.pop()
+            except IndexError:
+                continue
+            close_idx = tidx
+            tlist.group_tokens(cls, open_idx, close_idx)
+            tidx_offset += close_idx - open_idx
+
+
+def _tree(token):
+    if token.is_group:
+        return type(token).__name__, [_tree(t) for t in token.tokens]
+    return token.ttype, token.value
+
+
+def _ungrouped(s):
+    return list(FilterStack().run(s))
+
+
+def _assert_same_as_passes(s):
+    for stmt, ref in zip(_ungrouped(s), _ungrouped(s)):
+        for cls in MATCHING_CLASSES:
+            _group_matching_pass(ref, cls)
+        grouping.group_matching(stmt)
+        assert _tree(stmt) == _tree(ref)
+
+
+@pytest.mark.parametrize('s', [
+    'select (a, [b, (c)], case when (d) then [e] end) from t',
+    'select ((a) from t',
+    'select a)) from (t',
+    'select [a, (b] c)',
+    'select (a [b) c]',
+    'select case when a then (b end) end',
+    'select case (when a then b) end end',
+    'begin if a then (b); end if; end',
+    'begin if a then b; end; end if',
+    'if a then begin b; end if; end',
+    'for x in (select 1) loop begin y; end; end loop',
+    'for x in y loop if a then b; end loop; end if',
+    'foreach x in array y loop case when a then b end; end loop',
+    'begin begin end end end begin',
+    'end if ) ] end loop end ( [ case begin',
+    'select a /* ( [ case */ from t -- begin\n where (b]',
+])
+def test_group_matching_same_as_passes(s):
+    _assert_same_as_passes(s)
+
+
+def test_group_matching_same_as_passes_random():
+    words = ['(', ')', '[', ']', 'case', 'when', 'then', 'end', 'if',
+             'end if', 'for', 'foreach', 'loop', 'end loop', 'begin', ';',
+             'select', 'a', 'b.c', ',', '/* c */', '-- c\n', 'declare',
+             'x := 1']
+    rnd = random.Random(22)
+    for _ in range(500):
+        _assert_same_as_passes(
+            ' '.join(rnd.choice(words) for _ in range(rnd.randrange(40))))
+
+
+@pytest.mark.parametrize('s', [
+    'a := := b := c;',
+    'a:=:= + b := x;',
+])
+def test_group_assignment_after_grouped_match(s):
+    # the second ':=' is grouped with the first before it's reached
+    stmt, = sqlparse.parse(s)
+    assert str(stmt) == s
+    assert isinstance(stmt.tokens[0], sql.Assignment)
+
+
+def test_resolve_passes_blocks():
+    assert grouping.resolve_passes('blocks') == frozenset(
+        [grouping.group_matching])
+    stmt, = sqlparse.parse('select (a), b.c from t', grouping='blocks')
+    assert isinstance(stmt.tokens[2], sql.Parenthesis)
+    assert not any(isinstance(token, sql.Identifier)
+                   for token in stmt.tokens)
+
+
+def test_resolve_passes_identifiers():
+    passes = grouping.resolve_passes('identifiers')
+    assert grouping.group_identifier_list in passes
+    assert grouping.group_identifier in passes
+    # all block passes are required, they're matched in a single scan
+    assert grouping.group_matching in passes
+    assert grouping.group_parenthesis not in passes
+    assert grouping.group_where not in passes
+    stmt, = sqlparse.parse('select a, b from t where c = 1',
+                           grouping='identifiers')
+    assert isinstance(stmt.tokens[2], sql.IdentifierList)
+    assert not any(isinstance(token, sql.Where) for token in stmt.tokens)
+
+
+@pytest.mark.parametrize('passes, expected', [
+    (['group_parenthesis'],
+     [grouping.group_parenthesis, grouping.group_brackets]),
+    ([grouping.group_functions],
+     [grouping.group_functions, grouping.group_parenthesis,
+      grouping.group_brackets]),
+    ('group_where', [grouping.group_where, grouping.group_matching]),
+    (grouping.group_comments, [grouping.group_comments]),
+    ([], []),
+])
+def test_resolve_passes_requires(passes, expected):
+    assert grouping.resolve_passes(passes) == frozenset(expected)
+
+
+@pytest.mark.parametrize('passes', [
+    'group_nothing', ['group_nothing'], [len], None, 1])
+def test_resolve_passes_invalid(passes):
+    with pytest.raises(SQLParseError):
+        grouping.resolve_passes(passes)
+    with pytest.raises(SQLParseError):
+        sqlparse.parse('select 1', grouping=passes)
+
+
+@pytest.mark.parametrize('spans', [False, True])
+def test_group_triggers_same_as_all_passes(spans):
+    # Passes are skipped if the summary of a statement lacks their trigger
+    # tokens, grouping must be the same as running all of them.
+    words = ['select', 'insert into', 'values', 'update', 'set', 'from',
+             'where', 'order by', 'group by', 'asc', 'as', 'and', 'or', 'not',
+             'in', 'like', 'is null', 'case', 'when', 'then', 'else', 'end',
+             'if', 'end if', 'for', 'foreach', 'loop', 'end loop', 'begin',
+             'declare', 'a', 'b.c', 'd.*', '"e"', '`f`', '[g]', "'h'", '1',
+             '2.5', '$1', '%s', ':x', '@v', '*', '+', '-', '||', '=', '<',
+             '!=', ':=', '::', '::int', 'at time zone', "timestamp '2020'",
+             "interval '1 day'", 'count(', 'x(', '(', ')', '[', ']', ',',
+             ';', '/* c */', '-- c\n', 'over', 'with', 'null']
+    rnd = random.Random(21)
+    texts = [' '.join(rnd.choice(words) for _ in range(rnd.randrange(30)))
+             for _ in range(300)]
+    texts.append("select a.b::int as c, case when d then 'e' end from f "
+                 "where g at time zone 'utc' = timestamp '2020' order by 1")
+    for text in texts:
+        stack, ref_stack = FilterStack(), FilterStack()
+        if spans:
+            stack.enable_spans()
+            ref_stack.enable_spans()
+        for stmt, ref in zip(stack.run(text), ref_stack.run(text)):
+            assert stmt.summary is not None
+            ref.summary = None
+            grouping.group(stmt)
+            grouping.group(ref)
+            assert _tree(stmt) == _tree(ref)
+
+
+@pytest.mark.parametrize('s, comments', [
+    ('select /*c*/a', ['/*c*/']),
+    ('select /* c */ -- d\n a', ['/* c */ -- d\n ']),
+    ('select a /* c */', []),
+    ('select (/*c*/a) /*d*/, b', ['/*c*/', '/*d*/']),
+])
+def test_group_comments(s, comments):
+    stmt, = sqlparse.parse(s)
+    assert [str(token) for token in _walk(stmt)
+            if isinstance(token, sql.Comment)] == comments
+
+
+def _walk(tlist):
+    stack = [tlist]
+    while stack:
+        token = stack.pop(0)
+        yield token
+        if token.is_group:
+            stack[:0] = token.tokens
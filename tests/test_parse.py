@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import pytest
+
+import sqlparse
+from sqlparse import sql
+
+# Well beyond the recursion limit, the trees are walked with explicit
+# stacks. Reindenting isn't tested, its output grows quadratically.
+DEPTH = max(10000, 4 * sys.getrecursionlimit())
+
+BUDGET = 10.0  # seconds per input
+# Nesting four times as deep may take at most this much longer. Linear
+# time would make it 4, quadratic time 16.
+MAX_RATIO = 10.0
+
+
+def _assert_linear(timed, elapsed, func, shallow):
+    """Checks *elapsed* of an input nested DEPTH levels deep against the
+    best time *func* takes for the input *shallow*, nested DEPTH // 4
+    levels deep."""
+    assert elapsed < BUDGET
+    assert elapsed < MAX_RATIO * min(timed(func, shallow)[1]
+                                     for _ in range(3))
+
+
+def _nested(inner, depth):
+    return u'select ' + u'(' * depth + inner + u')' * depth + u' from t'
+
+
+def _nested_comments(depth):
+    return (u'select ' + u'( /* c */ ' * depth + u'1'
+            + u' ) -- c\n' * depth + u'from t')
+
+
+def _format(s):
+    return sqlparse.format(s, strip_comments=True, strip_whitespace=True,
+                           use_space_around_operators=True)
+
+
+def _depth(stmt):
+    """Returns the nesting depth of parenthesis in *stmt*."""
+    depth = 0
+    stack = [(stmt, 0)]
+    while stack:
+        tlist, level = stack.pop()
+        if isinstance(tlist, sql.Parenthesis):
+            level += 1
+            depth = max(depth, level)
+        stack.extend((sgroup, level) for sgroup in tlist.get_sublists())
+    return depth
+
+
+@pytest.mark.parametrize('inner', [
+    u'1',
+    u'a + b',
+    u'select x from t where y = 1',
+])
+def test_parse_deeply_nested(timed, inner):
+    s = _nested(inner, DEPTH)
+    (stmt,), elapsed = timed(sqlparse.parse, s)
+    assert _depth(stmt) == DEPTH
+    assert u''.join(token.value for token in stmt.flatten()) == s
+    assert str(stmt) == s
+    assert stmt.get_type() == 'SELECT'
+    _assert_linear(timed, elapsed, sqlparse.parse, _nested(inner, DEPTH // 4))
+
+
+def test_format_deeply_nested(timed):
+    formatted, elapsed = timed(_format, _nested_comments(DEPTH))
+    assert formatted == (u'select ' + u'(' * DEPTH + u'1' + u' )' * DEPTH
+                         + u' from t')
+    _assert_linear(timed, elapsed, _format, _nested_comments(DEPTH // 4))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Time budgets for lexing adversarial input.
+
+Unterminated literals, comments and quoted names, long runs of unmatched
+characters and repeated opening delimiters must be lexed in linear time.
+A lexer retrying the delimited rules from every offset takes minutes on
+these inputs, the budget leaves plenty of room for slow machines.
+"""
+
+import io
+
+import pytest
+
+import sqlparse
+from sqlparse import lexer
+
+N = 50000
+BUDGET = 5.0  # seconds per input
+
+ADVERSARIAL = [
+    # unterminated
+    u"select '" + u'a' * N,
+    u'select "' + u'a b' * N,
+    u'select /*' + u'x ' * N,
+    u'select /*+' + u'x ' * N,
+    u'select $tag$' + u'x ' * N,
+    u'select `' + u'x ' * N,
+    u'select \xb4' + u'x ' * N,
+    u'select [' + u'x ' * N,
+    # unmatched characters
+    u'☃' * N,
+    u'{}' * N,
+    # repeated delimiters
+    u'/* ' * N,
+    u'/*+ ' * N,
+    u''.join(u'$t{0}$ '.format(i) for i in range(N // 2)),
+    u' [' * N,
+    u"'" * N,
+    u'"' * N,
+    u'`' * N,
+    u";'" * N,
+    u"'a\" /*$x$ [`" * (N // 10),
+]
+
+
+def _ids(sql):
+    return repr(sql[:12])
+
+
+@pytest.mark.parametrize('dialect', [None, 'mysql', 'postgresql'])
+@pytest.mark.parametrize('sql', ADVERSARIAL, ids=_ids)
+def test_tokenize_adversarial(timed, sql, dialect):
+    tokens, elapsed = timed(list, lexer.tokenize(sql, dialect=dialect))
+    assert elapsed < BUDGET
+    assert u''.join(value for _, value in tokens) == sql
+
+
+@pytest.mark.parametrize('sql', ADVERSARIAL, ids=_ids)
+def test_tokenize_stream_adversarial(timed, sql):
+    tokens, elapsed = timed(list, lexer.tokenize(io.StringIO(sql)))
+    assert elapsed < BUDGET
+    assert u''.join(value for _, value in tokens) == sql
+
+
+@pytest.mark.parametrize('sql', ADVERSARIAL, ids=_ids)
+def test_split_adversarial(timed, sql):
+    _, elapsed = timed(sqlparse.split, sql)
+    assert elapsed < BUDGET
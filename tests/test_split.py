@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+import sqlparse
+from sqlparse import lexer
+from sqlparse.engine import StatementSplitter
+from sqlparse.sql import TokenTable
+
+WORDS = [
+    u'select', u'a', u'from', u't', u';', u';', u' ', u'\n', u'(', u')',
+    u"'x;y'", u'"q;"', u'-- c;\n', u'/* ; */', u'begin', u'end', u'if',
+    u'end if', u'case', u'when', u'then', u'create function f() as',
+    u'$$ b; $$', u'declare', u'cursor', u'loop', u'end loop', u'go',
+    u'create', u'table', u'{', u'☃',
+]
+
+STATEMENTS = [
+    u'',
+    u'select 1; select 2',
+    u'select 1;  -- c\n select 2;\n\n',
+    u'create function f() returns int as $$ begin return 1; end; $$ '
+    u'language plpgsql; select f();',
+    u"begin select 'a;b'; end; select 1",
+]
+
+
+def _random_sql(rnd):
+    return u' '.join(rnd.choice(WORDS) for _ in range(rnd.randrange(40)))
+
+
+def _corpus():
+    rnd = random.Random(11)
+    return STATEMENTS + [_random_sql(rnd) for _ in range(300)]
+
+
+def _stream_statements(text):
+    return list(StatementSplitter().process(lexer.tokenize(text)))
+
+
+def test_split_same_as_stream():
+    for text in _corpus():
+        assert sqlparse.split(text) == [
+            str(stmt).strip() for stmt in _stream_statements(text)]
+
+
+def test_process_table_same_as_stream():
+    for text in _corpus():
+        table = TokenTable.from_spans(lexer.Lexer.get_spans(text), text)
+        stmts = list(StatementSplitter().process_table(table))
+        ref = _stream_statements(text)
+        assert len(stmts) == len(ref)
+        for stmt, ref_stmt in zip(stmts, ref):
+            assert [(t.ttype, t.value) for t in stmt.tokens] == [
+                (t.ttype, t.value) for t in ref_stmt.tokens]
+            assert stmt.summary == ref_stmt.summary
+            assert str(stmt) == str(ref_stmt)
+
+
+@pytest.mark.parametrize('text', STATEMENTS)
+def test_token_table(text):
+    tokens = list(lexer.tokenize(text))
+    table = TokenTable.from_spans(lexer.Lexer.get_spans(text), text)
+    assert list(table.items()) == tokens
+    assert list(TokenTable.from_tokens(tokens).items()) == tokens
+    assert [(t.ttype, t.value) for t in table] == tokens
+    if tokens:
+        assert table.value(0, len(table)) == text
+        assert table[-1].value == tokens[-1][1]
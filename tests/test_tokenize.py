@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import io
+import random
+
+import pytest
+
+from sqlparse import lexer
+from sqlparse.lexer import Lexer
+
+# Fragments of SQL that are joined at random, unterminated literals,
+# comments, quoted names and dollar bodies included.
+FRAGMENTS = [
+    u'select', u'a', u'b.c', u' ', u'\n', u',', u';', u'(', u')', u'[',
+    u']', u'[x y]', u'1.5', u'+', u'*', u'/', u'-', u'left outer join',
+    u'at time zone', u'order by', u"'", u"'s'", u"''", u"\\'", u'\\',
+    u'"', u'"q"', u'`', u'`n`', u'\xb4', u'/*', u'*/', u'/* c */', u'/*+',
+    u'-- c\n', u'# c\n', u'$', u'$$', u'$a$', u'$A$', u'$b$', u'x$a$y',
+    u'{', u'☃', u':=', u'::', u'@v', u'%s', u'?',
+]
+
+
+def _random_sql(rnd, count):
+    return u''.join(rnd.choice(FRAGMENTS) for _ in range(count))
+
+
+def _spans(text, dialect=None):
+    return list(Lexer.get_spans(text, dialect=dialect))
+
+
+@pytest.mark.parametrize('text, offset, removed, inserted', [
+    (u'', 0, 0, u''),
+    (u'', 0, 0, u"select 'a'"),
+    (u"select 'a", 0, 0, u'x'),
+    (u"select 'a", 9, 0, u"'"),
+    (u"select 'a' from t", 0, 17, u''),
+    (u"select 'a from t where b = 1", 26, 1, u"2'"),
+    (u'select /* a from t where b = 1', 30, 0, u' */'),
+    (u'select $a$ b from t where c = 1', 30, 0, u'$A$'),
+    (u"select $a$ 'b $a$ from t", 23, 1, u''),
+    (u'select [a from t', 16, 0, u']'),
+    (u'select a from t left join u', 16, 0, u'outer '),
+])
+def test_relex(text, offset, removed, inserted):
+    new_text, spans = lexer.relex(text, _spans(text), offset, removed,
+                                  inserted)
+    assert new_text == text[:offset] + inserted + text[offset + removed:]
+    assert spans == _spans(new_text)
+
+
+@pytest.mark.parametrize('dialect', [None, 'mysql', 'postgresql'])
+def test_relex_random(dialect):
+    rnd = random.Random(4)
+    for _ in range(200):
+        text = _random_sql(rnd, rnd.randrange(30))
+        spans = _spans(text, dialect)
+        for _ in range(10):
+            offset = rnd.choice([0, len(text), rnd.randint(0, len(text))])
+            removed = rnd.randint(0, min(3, len(text) - offset))
+            inserted = _random_sql(rnd, rnd.randrange(3))
+            text, spans = lexer.relex(text, spans, offset, removed,
+                                      inserted, dialect)
+            assert spans == _spans(text, dialect)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 12))
+def test_stream_tokens_random(chunk_size):
+    rnd = random.Random(chunk_size)
+    texts = [
+        u"select /* a\nlong comment */ $body$ a; 'b' $body$, 'x''y' from t",
+        u"select '" + u'a' * 40 + u"', \"" + u'b ' * 20 + u'"',
+        u'select $a$ /* $a$ */ -- c\n[x y z] from t',
+    ]
+    texts.extend(_random_sql(rnd, rnd.randrange(60)) for _ in range(200))
+    for text in texts:
+        stream = Lexer.get_stream_tokens(io.StringIO(text), chunk_size)
+        assert list(stream) == list(Lexer.get_tokens(text))
+
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 6))
+@pytest.mark.parametrize('encoding', [None, 'utf-8'])
+def test_stream_tokens_encoding(chunk_size, encoding):
+    text = u'select \xe9, \u4e2d from t -- \u20ac\n'
+    stream = io.BytesIO(text.encode('utf-8'))
+    tokens = Lexer.get_stream_tokens(stream, chunk_size, encoding=encoding)
+    assert list(tokens) == list(Lexer.get_tokens(text))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4])
+def test_stream_tokens_encoding_fallback(chunk_size):
+    text = b'select \xe9 from t'
+    stream = io.BytesIO(text)
+    tokens = Lexer.get_stream_tokens(stream, chunk_size)
+    assert list(tokens) == list(Lexer.get_tokens(text))
+    stream = io.BytesIO(text)
+    tokens = Lexer.get_stream_tokens(stream, chunk_size, encoding='latin-1')
+    assert list(tokens) == list(Lexer.get_tokens(text, 'latin-1'))
+
+@pytest.mark.parametrize('shard_size', [7, 40])
+def test_parallel_spans(shard_size):
+    rnd = random.Random(9)
+    text = u'\n'.join(
+        [u"select /* a\ncomment */ 'b\nc' from t", u'-- d\ninsert $a$',
+         u'select $a$, "e\nf" from u;', u'delete [g\nh]'] +
+        [_random_sql(rnd, rnd.randrange(40)) for _ in range(50)])
+    spans = Lexer.get_parallel_spans(text, processes=2,
+                                     shard_size=shard_size)
+    assert list(spans) == _spans(text)